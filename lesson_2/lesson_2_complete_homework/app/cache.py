@@ -0,0 +1,404 @@
+import asyncio
+import logging
+import math
+import random
+import time
+import uuid
+from app.config import settings
+from app.metrics import record_cache
+from app.redis_client import redis_client
+
+logger = logging.getLogger("cache")
+
+# Версия списка объектов: входит в ключи кэша страниц и растёт при каждом изменении
+ITEMS_LIST_VERSION_KEY = "items:list_version"
+# Тег всех закэшированных страниц списка объектов
+ITEMS_PAGES_TAG = "items:pages"
+
+
+# Объединение одновременных загрузок одного ключа внутри процесса (single-flight)
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}  # key -> задача, выполняющая загрузку
+
+    async def do(self, key, loader):
+        """
+        Выполняет loader один раз для всех одновременных вызовов с одним ключом.
+        Остальные вызовы ждут результат той же задачи.
+        :param key: Ключ, по которому объединяются вызовы.
+        :param loader: Асинхронная функция без аргументов.
+        :return: Результат loader.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(loader())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # shield: отмена одного ожидающего запроса не отменяет загрузку для остальных
+        return await asyncio.shield(task)
+
+    def in_flight(self, key):
+        """
+        Проверяет, выполняется ли сейчас загрузка с этим ключом.
+        """
+        return key in self._calls
+
+
+single_flight = SingleFlight()
+
+# Ссылки на фоновые задачи обновления, чтобы их не собрал сборщик мусора
+_background_tasks = set()
+
+# Счётчики обращений к записям кэша: попадания в отрицательные записи
+# (объекта нет) считаются отдельно от обычных попаданий
+counters = {"hits": 0, "negative_hits": 0, "misses": 0, "negative_stores": 0}
+
+
+def make_entry(value, ex, delta):
+    """
+    Формирует запись кэша с логическим сроком истечения и стоимостью вычисления.
+    :param value: Кэшируемое JSON-значение.
+    :param ex: Логическое время жизни в секундах.
+    :param delta: Сколько секунд заняло вычисление значения.
+    :return: Словарь {"v": значение, "exp": момент истечения, "delta": стоимость}.
+    """
+    return {"v": value, "exp": time.time() + ex, "delta": delta}
+
+
+def make_tombstone(ex):
+    """
+    Формирует отрицательную запись кэша: объекта нет в источнике.
+    :param ex: Время жизни в секундах.
+    """
+    return {"v": None, "exp": time.time() + ex, "delta": 0.0, "neg": 1}
+
+
+def is_tombstone(entry):
+    """
+    Проверяет, является ли запись отрицательной.
+    """
+    return bool(entry.get("neg"))
+
+
+def _count(key, entry):
+    """
+    Учитывает обращение к записи в счётчиках и в метриках по префиксу ключа.
+    """
+    if entry is None:
+        counters["misses"] += 1
+        record_cache(key, "miss")
+    elif is_tombstone(entry):
+        counters["negative_hits"] += 1
+        record_cache(key, "negative")
+    else:
+        counters["hits"] += 1
+        record_cache(key, "hit")
+
+
+def stats():
+    """
+    Возвращает счётчики обычных и отрицательных попаданий и промахов.
+    """
+    return dict(counters)
+
+
+def _usable(entry, versioned=False):
+    """
+    Проверяет, что запись в текущем формате: с логическим сроком, а для
+    версионируемых значений — с полем "version" (отрицательные записи его не имеют).
+    Записи старого формата считаются промахом.
+    """
+    if "exp" not in entry:
+        return False
+    return not versioned or is_tombstone(entry) or "version" in entry["v"]
+
+
+def should_refresh(entry):
+    """
+    Проверяет, пора ли обновлять запись (XFetch).
+    Чем дороже вычисление и ближе истечение, тем выше вероятность раннего обновления.
+    Логически истёкшая запись обновляется всегда.
+    """
+    # 1 - random() лежит в (0, 1], поэтому логарифм определён
+    early = entry["delta"] * settings.CACHE_XFETCH_BETA * -math.log(1 - random.random())
+    return time.time() + early >= entry["exp"]
+
+
+async def set_value(
+    key, value, ex=None, delta=0.0, broadcast=True, version=None, mode="cas", tags=()
+):
+    """
+    Сохраняет значение в кэш в виде записи с логическим сроком истечения.
+    Физический TTL ключа больше логического на CACHE_STALE_GRACE,
+    чтобы истёкшее значение можно было отдавать, пока идёт обновление.
+    :param key: Ключ кэша.
+    :param value: JSON-значение.
+    :param ex: Логическое время жизни в секундах (по умолчанию CACHE_EXPIRE).
+    :param delta: Стоимость вычисления значения в секундах.
+    :param broadcast: Рассылать ли инвалидацию L1 другим процессам.
+    :param version: Версия значения: если задана, запись выполняется через
+                    compare-and-set и не затирает значение более новой версии.
+    :param mode: Режим записи с версией: "cas", "nx" или "force".
+    :param tags: Теги ключа для совместной инвалидации (redis_client.invalidate_tag).
+    :return: True, если значение записано (без версии — всегда).
+    """
+    ex = ex if ex is not None else settings.CACHE_EXPIRE
+    entry = make_entry(value, ex, delta)
+    if version is not None:
+        return await redis_client.set_versioned(
+            key,
+            entry,
+            version,
+            ex=ex + settings.CACHE_STALE_GRACE,
+            mode=mode,
+            broadcast=broadcast,
+            tags=tags,
+        )
+    await redis_client.set_cached(
+        key, entry, ex=ex + settings.CACHE_STALE_GRACE, broadcast=broadcast, tags=tags
+    )
+    return True
+
+
+async def set_tombstone(key, ex=None, broadcast=True, version=None, tags=()):
+    """
+    Запоминает в кэше, что объекта нет, чтобы повторные запросы не шли в базу.
+    Отрицательная запись не отдаётся после истечения (без CACHE_STALE_GRACE).
+    :param key: Ключ кэша.
+    :param ex: Время жизни в секундах (по умолчанию CACHE_NEGATIVE_TTL).
+    :param broadcast: Рассылать ли инвалидацию L1 другим процессам.
+    :param version: Версия удаления (compare-and-set, как у set_value).
+                    Отсутствие объекта, прочитанное из базы, имеет версию 0
+                    и не затирает ни сохранённый объект, ни запись об удалении.
+    :param tags: Теги ключа, как у set_value.
+    :return: True, если запись сохранена.
+    """
+    ex = ex if ex is not None else settings.CACHE_NEGATIVE_TTL
+    if version is not None:
+        stored = await redis_client.set_versioned(
+            key, make_tombstone(ex), version, ex=ex, broadcast=broadcast, tags=tags
+        )
+    else:
+        await redis_client.set_cached(
+            key, make_tombstone(ex), ex=ex, broadcast=broadcast, tags=tags
+        )
+        stored = True
+    if stored:
+        counters["negative_stores"] += 1
+    return stored
+
+
+async def set_tombstones(keys, ex=None, version=None):
+    """
+    Сохраняет несколько отрицательных записей одним конвейером.
+    :param keys: Список ключей.
+    :param ex: Время жизни в секундах (по умолчанию CACHE_NEGATIVE_TTL).
+    :param version: Версия записей (compare-and-set, как у set_tombstone).
+    """
+    ex = ex if ex is not None else settings.CACHE_NEGATIVE_TTL
+    if version is not None:
+        stored = await redis_client.mset_versioned(
+            {key: (make_tombstone(ex), version) for key in keys}, ex=ex
+        )
+        counters["negative_stores"] += len(stored)
+        return
+    counters["negative_stores"] += len(keys)
+    await redis_client.mset_cached({key: make_tombstone(ex) for key in keys}, ex=ex)
+
+
+async def get_many(keys, versioned=False):
+    """
+    Получает несколько значений из кэша за один запрос к Redis.
+    Записи, которые пора обновлять, считаются отсутствующими,
+    чтобы вызывающий код перезагрузил их вместе с промахами.
+    :param keys: Список ключей.
+    :param versioned: Значения — словари с полем "version" (см. get_or_load).
+    :return: Словарь ключ -> значение для свежих записей
+             (None — отрицательная запись, объекта нет).
+    """
+    entries = await redis_client.mget_cached(keys)
+    fresh = {}
+    for key in keys:
+        entry = entries.get(key)
+        if entry is not None and (
+            not _usable(entry, versioned) or should_refresh(entry)
+        ):
+            entry = None
+        _count(key, entry)
+        if entry is not None:
+            fresh[key] = entry["v"]
+    return fresh
+
+
+async def set_many(
+    mapping, ex=None, delta=0.0, broadcast=False, versioned=False, mode="cas"
+):
+    """
+    Сохраняет несколько значений в кэш одним конвейером.
+    :param mapping: Словарь ключ -> JSON-значение.
+    :param ex: Логическое время жизни в секундах (по умолчанию CACHE_EXPIRE).
+    :param delta: Стоимость вычисления значений в секундах.
+    :param broadcast: Рассылать ли инвалидацию L1 другим процессам
+                      (нужно, если значения изменились, а не прочитаны из базы).
+    :param versioned: Значения — словари с полем "version": запись выполняется
+                      через compare-and-set, как у set_value с version.
+    :param mode: Режим записи с версией: "cas", "nx" или "force".
+    """
+    ex = ex if ex is not None else settings.CACHE_EXPIRE
+    if versioned:
+        await redis_client.mset_versioned(
+            {
+                key: (make_entry(value, ex, delta), value["version"])
+                for key, value in mapping.items()
+            },
+            ex=ex + settings.CACHE_STALE_GRACE,
+            mode=mode,
+            broadcast=broadcast,
+        )
+        return
+    await redis_client.mset_cached(
+        {key: make_entry(value, ex, delta) for key, value in mapping.items()},
+        ex=ex + settings.CACHE_STALE_GRACE,
+        broadcast=broadcast,
+    )
+
+
+async def get_or_load(key, loader, ex=None, versioned=False, tags=()):
+    """
+    Возвращает значение из кэша или загружает его, защищаясь от cache stampede.
+    Внутри процесса одновременные промахи ждут одну загрузку,
+    между процессами перестроение выполняет владелец блокировки в Redis.
+    Истёкшее, но ещё хранящееся значение отдаётся сразу, а обновляется в фоне;
+    незадолго до истечения запись может быть обновлена заранее (XFetch).
+    :param key: Ключ кэша.
+    :param loader: Асинхронная функция без аргументов, возвращающая JSON-значение или None.
+                   Может выполняться в фоне после ответа, поэтому сама открывает сессию БД.
+                   Если loader вернул None, на CACHE_NEGATIVE_TTL сохраняется отрицательная запись.
+    :param ex: Логическое время жизни в секундах (по умолчанию CACHE_EXPIRE).
+    :param versioned: loader возвращает словарь с полем "version" (версия строки в базе).
+                      Тогда загруженное значение записывается через compare-and-set:
+                      если пока шла загрузка, объект обновили и в кэше уже более новая
+                      версия, устаревшее значение её не затрёт.
+    :param tags: Теги, с которыми сохраняется загруженное значение (см. set_value).
+    :return: Значение или None, если объекта нет.
+    """
+    entry = await redis_client.get_cached(key)
+    # Записи старого формата считаем промахом
+    if entry is not None and not _usable(entry, versioned):
+        entry = None
+    _count(key, entry)
+    if entry is not None:
+        if should_refresh(entry):
+            _refresh_in_background(key, loader, ex, versioned, tags)
+        return entry["v"]
+    return await single_flight.do(
+        key, lambda: _load_with_lock(key, loader, ex, versioned=versioned, tags=tags)
+    )
+
+
+def _refresh_in_background(key, loader, ex, versioned, tags):
+    """
+    Запускает фоновое обновление записи, если оно ещё не идёт в этом процессе.
+    У обновления свой ключ single-flight: уступив блокировку другому процессу,
+    оно возвращает None, и промахи, присоединившиеся к нему, получили бы None
+    вместо значения. Промахи всегда ждут только собственную загрузку.
+    """
+    refresh_key = f"refresh:{key}"
+    if single_flight.in_flight(refresh_key):
+        return
+    task = asyncio.ensure_future(
+        single_flight.do(
+            refresh_key,
+            lambda: _load_with_lock(
+                key, loader, ex, wait=False, versioned=versioned, tags=tags
+            ),
+        )
+    )
+    _background_tasks.add(task)
+    task.add_done_callback(_background_done)
+
+
+def _background_done(task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Ошибка фоновой задачи кэша: %r", task.exception())
+
+
+async def _load_with_lock(key, loader, ex, wait=True, versioned=False, tags=()):
+    """
+    Загружает значение под блокировкой lock:<key>.
+    Если блокировку держит другой процесс, ждёт появления значения в кэше,
+    а по истечении CACHE_LOCK_WAIT загружает его самостоятельно.
+    При фоновом обновлении (wait=False) просто уступает перестроение другому процессу.
+    """
+    lock_key = f"lock:{key}"
+    token = uuid.uuid4().hex
+    acquired = await redis_client.acquire_lock(
+        lock_key, token, px=settings.CACHE_LOCK_TIMEOUT_MS
+    )
+
+    if not acquired:
+        if not wait:
+            return None
+        deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(settings.CACHE_LOCK_POLL_INTERVAL)
+            entry = await redis_client.get_cached(key)
+            if entry is not None and _usable(entry, versioned):
+                return entry["v"]
+
+    try:
+        started = time.monotonic()
+        value = await loader()
+        if value is not None:
+            delta = time.monotonic() - started
+            # Фоновое обновление заменяет значение, которое могло осесть в L1 других процессов
+            await set_value(
+                key,
+                value,
+                ex=ex,
+                delta=delta,
+                broadcast=not wait,
+                version=value["version"] if versioned else None,
+                tags=tags,
+            )
+        else:
+            # Объекта нет в источнике: запоминаем это, а при фоновом обновлении
+            # заодно вытесняем устаревшую запись из L1 других процессов
+            await set_tombstone(
+                key,
+                broadcast=not wait,
+                version=0 if versioned else None,
+                tags=tags,
+            )
+        return value
+    finally:
+        if acquired:
+            await redis_client.release_lock(lock_key, token)
+
+
+async def invalidate_item_pages():
+    """
+    Сбрасывает закэшированные страницы списка объектов после изменения.
+    Рост версии списка (она входит в ключи страниц) сразу делает прежние страницы
+    недоступными, поэтому запрос ждёт только INCR. Удаление страниц по тегу
+    ITEMS_PAGES_TAG лишь освобождает память раньше TTL и выполняется в фоне.
+    """
+    await redis_client.incr(ITEMS_LIST_VERSION_KEY)
+    _sweep_in_background(ITEMS_PAGES_TAG)
+
+
+def _sweep_in_background(tag):
+    """
+    Запускает фоновое удаление ключей тега (не больше CACHE_TAG_MAX_KEYS за раз),
+    если оно ещё не идёт в этом процессе. Ключи, помеченные после его завершения,
+    удалит следующее изменение или TTL.
+    """
+    sweep_key = f"sweep:{tag}"
+    if single_flight.in_flight(sweep_key):
+        return
+    task = asyncio.ensure_future(
+        single_flight.do(sweep_key, lambda: redis_client.invalidate_tag(tag))
+    )
+    _background_tasks.add(task)
+    task.add_done_callback(_background_done)
@@ -0,0 +1,372 @@
+import asyncio
+import logging
+import time
+import uuid
+import redis.asyncio as redis
+from app.config import settings
+from app.redis_client import redis_client
+
+logger = logging.getLogger("change_stream")
+
+# Имя потребителя в группе. Пакеты группы обрабатывает один процесс за раз
+# (под блокировкой), поэтому имя общее: следующий владелец блокировки
+# сначала дочитывает неподтверждённые записи предыдущего, и порядок событий сохраняется
+CONSUMER_NAME = "worker"
+
+
+def group_lock_key(group):
+    """
+    Ключ блокировки группы: события группы обрабатываются одним процессом за раз.
+    """
+    return f"lock:{settings.CHANGE_STREAM}:{group}"
+
+
+def dead_letter_stream(group):
+    """
+    Поток для событий, которые группа не смогла обработать за CHANGE_STREAM_MAX_ATTEMPTS попыток.
+    """
+    return f"{settings.CHANGE_STREAM}:dead:{group}"
+
+
+def _entry_order(entry_id):
+    """
+    Преобразует ID записи потока "<ms>-<seq>" в кортеж для сравнения.
+    """
+    ms, seq = entry_id.split("-")
+    return int(ms), int(seq)
+
+
+def _change_fields(op, item_id, item=None, version=None):
+    """
+    Поля события изменения: операция, ID, версия и, для upsert, полное состояние объекта.
+    Версия upsert — версия строки (item["version"]), версия delete — следующая
+    после последней версии строки (как у записи об удалении в кэше).
+    """
+    if op == "delete":
+        return {"op": "delete", "id": item_id, "version": version}
+    return {
+        "op": "upsert",
+        "id": item_id,
+        "version": item["version"],
+        "name": item["name"],
+        "description": item["description"],
+    }
+
+
+async def publish_change(op, item_id, item=None, version=None):
+    """
+    Публикует изменение объекта в поток изменений (XADD MAXLEN ~).
+    Событие публикуется после фиксации, поэтому события одного объекта могут попасть
+    в поток не в порядке фиксации: по версии потребители отбрасывают устаревшие.
+    :param op: "upsert" (создание или обновление) или "delete".
+    :param item_id: ID объекта.
+    :param item: Словарь ItemSchema для upsert.
+    :param version: Версия удаления для delete.
+    """
+    await redis_client.redis.xadd(
+        settings.CHANGE_STREAM,
+        _change_fields(op, item_id, item, version),
+        maxlen=settings.CHANGE_STREAM_MAXLEN,
+        approximate=True,
+    )
+
+
+async def publish_changes(op, items):
+    """
+    Публикует изменения нескольких объектов одним конвейером XADD.
+    :param op: "upsert" или "delete".
+    :param items: Словари ItemSchema (для delete — {"id", "version"}).
+    """
+    async with redis_client.pipeline() as pipe:
+        for item in items:
+            pipe.xadd(
+                settings.CHANGE_STREAM,
+                _change_fields(op, item["id"], item, item.get("version")),
+                maxlen=settings.CHANGE_STREAM_MAXLEN,
+                approximate=True,
+            )
+        await pipe.execute()
+
+
+def _decode(entry_id, fields):
+    """
+    Преобразует запись потока в событие для потребителей.
+    """
+    item_id = int(fields["id"])
+    # События, опубликованные до появления версий, считаются самыми старыми
+    version = int(fields.get("version", 0))
+    item = None
+    if fields["op"] == "upsert":
+        item = {
+            "id": item_id,
+            "name": fields["name"],
+            "description": fields["description"],
+            "version": version,
+        }
+    return {
+        "entry_id": entry_id,
+        "op": fields["op"],
+        "id": item_id,
+        "version": version,
+        "item": item,
+    }
+
+
+# Базовый класс потребителя потока изменений.
+# Каждый потребитель читает поток в своей группе, поэтому продвигается независимо
+# от остальных, а его позиция (checkpoint) хранится в Redis.
+# Пример:
+#     class AuditConsumer(ChangeConsumer):
+#         name = "audit"
+#
+#         async def handle(self, events):
+#             for event in events:
+#                 logger.info("%s %s", event["op"], event["id"])
+#
+#     change_stream.register(AuditConsumer())
+class ChangeConsumer:
+    name = None  # Имя группы в Redis
+    # С какого места читает новая группа: "$" — только новые события, "0" — с начала потока
+    start_id = "$"
+
+    async def handle(self, events):
+        """
+        Обрабатывает пакет событий в порядке их появления в потоке.
+        Событие — словарь {"entry_id", "op", "id", "version", "item"}, где item — полное
+        состояние объекта для "upsert" и None для "delete".
+        События одного объекта могут прийти не в порядке версий (публикация идёт
+        после фиксации), поэтому применять нужно только версии новее уже применённой
+        (как compare-and-set в set_versioned).
+        Исключение оставляет пакет неподтверждённым: он будет обработан повторно,
+        поэтому обработка должна быть идемпотентной.
+        """
+        raise NotImplementedError
+
+
+# Запуск зарегистрированных потребителей: фоновая задача на каждую группу
+class ChangeStream:
+    def __init__(self):
+        self.consumers = {}  # Имя группы -> потребитель
+        self._tasks = []  # Фоновые задачи групп
+        self._stopping = None  # Событие остановки
+        self.processed = {}  # Имя группы -> сколько событий обработано этим процессом
+        # Имя группы -> сколько пакетов (или отдельных событий) не удалось обработать
+        self.failed_batches = {}
+        # Имя группы -> (первая запись пакета, сколько попыток подряд не удалось)
+        self._failures = {}
+
+    def register(self, consumer):
+        """
+        Регистрирует потребителя. Повторная регистрация с тем же именем заменяет прежнего.
+        """
+        self.consumers[consumer.name] = consumer
+        self.processed.setdefault(consumer.name, 0)
+        self.failed_batches.setdefault(consumer.name, 0)
+
+    async def start(self):
+        """
+        Создаёт группы зарегистрированных потребителей (если их нет)
+        и запускает фоновые задачи.
+        """
+        for consumer in self.consumers.values():
+            try:
+                await redis_client.redis.xgroup_create(
+                    settings.CHANGE_STREAM,
+                    consumer.name,
+                    id=consumer.start_id,
+                    mkstream=True,
+                )
+            except redis.ResponseError as error:
+                if "BUSYGROUP" not in str(error):
+                    raise
+
+        self._stopping = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._run(consumer))
+            for consumer in self.consumers.values()
+        ]
+
+    async def stop(self):
+        """
+        Останавливает потребителей после текущих пакетов.
+        Необработанные события остаются в потоке.
+        """
+        if not self._tasks:
+            return
+        self._stopping.set()
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+
+    async def _run(self, consumer):
+        while not self._stopping.is_set():
+            try:
+                await self.process_once(consumer)
+            except Exception:
+                self.failed_batches[consumer.name] += 1
+                logger.exception("Потребитель %s не обработал пакет", consumer.name)
+                await asyncio.sleep(1)
+
+    async def process_once(self, consumer):
+        """
+        Берёт блокировку группы, читает пакет событий и передаёт его потребителю.
+        Сначала перечитываются неподтверждённые события (ID "0"), затем новые (">").
+        После успешной обработки пакет подтверждается (XACK) — это и есть checkpoint.
+        :return: Количество обработанных событий.
+        """
+        group = consumer.name
+        token = uuid.uuid4().hex
+        if not await redis_client.acquire_lock(
+            group_lock_key(group), token, px=settings.CHANGE_STREAM_LOCK_MS
+        ):
+            # Группу обрабатывает другой процесс — ждём своей очереди
+            try:
+                await asyncio.wait_for(
+                    self._stopping.wait(), settings.CHANGE_STREAM_BLOCK_MS / 1000
+                )
+            except asyncio.TimeoutError:
+                pass
+            return 0
+
+        try:
+            entries = await self._read(group, "0", block=None)
+            if not entries:
+                entries = await self._read(
+                    group, ">", block=settings.CHANGE_STREAM_BLOCK_MS
+                )
+            if not entries:
+                return 0
+
+            events = [
+                _decode(entry_id, fields) for entry_id, fields in entries if fields
+            ]
+            try:
+                if events:
+                    await consumer.handle(events)
+                handled = len(events)
+            except Exception:
+                if not self._attempts_exhausted(group, entries[0][0]):
+                    raise
+                logger.exception(
+                    "Потребитель %s не обработал пакет за %d попыток, "
+                    "события обрабатываются по одному",
+                    group,
+                    settings.CHANGE_STREAM_MAX_ATTEMPTS,
+                )
+                handled = await self._handle_one_by_one(consumer, events)
+            self._failures.pop(group, None)
+            self.processed[group] += handled
+
+            await redis_client.redis.xack(
+                settings.CHANGE_STREAM, group, *[entry_id for entry_id, _ in entries]
+            )
+            return len(events)
+        finally:
+            await redis_client.release_lock(group_lock_key(group), token)
+
+    async def _read(self, group, entry_id, block):
+        response = await redis_client.redis.xreadgroup(
+            group,
+            CONSUMER_NAME,
+            {settings.CHANGE_STREAM: entry_id},
+            count=settings.CHANGE_STREAM_BATCH_SIZE,
+            block=block,
+        )
+        return response[0][1] if response else []
+
+    def _attempts_exhausted(self, group, first_id):
+        """
+        Учитывает неудачную попытку обработать пакет, начинающийся с записи first_id.
+        :return: True, если пакет не удалось обработать CHANGE_STREAM_MAX_ATTEMPTS раз подряд.
+        """
+        previous_id, attempts = self._failures.get(group, (None, 0))
+        attempts = attempts + 1 if previous_id == first_id else 1
+        self._failures[group] = (first_id, attempts)
+        return attempts >= settings.CHANGE_STREAM_MAX_ATTEMPTS
+
+    async def _handle_one_by_one(self, consumer, events):
+        """
+        Обрабатывает события пакета по одному, чтобы одно ошибочное событие
+        не останавливало группу: события, которые не удалось обработать,
+        переносятся в поток недоставленных событий (dead_letter_stream).
+        :return: Количество обработанных событий.
+        """
+        handled = 0
+        for event in events:
+            try:
+                await consumer.handle([event])
+                handled += 1
+            except Exception:
+                logger.exception(
+                    "Потребитель %s пропускает событие %s",
+                    consumer.name,
+                    event["entry_id"],
+                )
+                self.failed_batches[consumer.name] += 1
+                await redis_client.redis.xadd(
+                    dead_letter_stream(consumer.name),
+                    {
+                        **_change_fields(
+                            event["op"], event["id"], event["item"], event["version"]
+                        ),
+                        "entry_id": event["entry_id"],
+                    },
+                    maxlen=settings.CHANGE_STREAM_MAXLEN,
+                    approximate=True,
+                )
+        return handled
+
+    async def replay(self, group, from_id="0"):
+        """
+        Переводит позицию группы назад: события после from_id будут доставлены снова.
+        Поток ограничен CHANGE_STREAM_MAXLEN, поэтому повторить можно только
+        события, которые ещё не вытеснены из него.
+        :param group: Имя группы.
+        :param from_id: ID записи, после которой начинается повтор ("0" — с начала потока).
+        :raises KeyError: если потребитель не зарегистрирован.
+        """
+        if group not in self.consumers:
+            raise KeyError(group)
+        await redis_client.redis.xgroup_setid(settings.CHANGE_STREAM, group, from_id)
+
+    async def stats(self):
+        """
+        Возвращает длину потока и состояние каждой группы: позицию (last_delivered_id),
+        сколько событий ещё не доставлено (lag), сколько доставлено, но не подтверждено,
+        и возраст самого старого из них.
+        """
+        stream = settings.CHANGE_STREAM
+        try:
+            groups = {
+                info["name"]: info
+                for info in await redis_client.redis.xinfo_groups(stream)
+            }
+        except redis.ResponseError:
+            # Поток ещё не создан
+            groups = {}
+
+        result = {}
+        for name in self.consumers:
+            info = groups.get(name, {})
+            oldest_age_ms = None
+            if info.get("pending"):
+                pending = await redis_client.redis.xpending(stream, name)
+                if pending["min"]:
+                    oldest_age_ms = (
+                        int(time.time() * 1000) - _entry_order(pending["min"])[0]
+                    )
+            result[name] = {
+                "last_delivered_id": info.get("last-delivered-id"),
+                "lag": info.get("lag"),
+                "pending": info.get("pending", 0),
+                "oldest_pending_age_ms": oldest_age_ms,
+                "processed": self.processed[name],
+                "failed_batches": self.failed_batches[name],
+            }
+        return {
+            "running": bool(self._tasks),
+            "stream_length": await redis_client.redis.xlen(stream),
+            "groups": result,
+        }
+
+
+change_stream = ChangeStream()
@@ -0,0 +1,135 @@
+import json
+
+# Необязательные зависимости: используются, только если выбраны в настройках
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Первый байт значения в Redis: младшие биты — формат сериализации, старшие — сжатие.
+# Значения заголовка не совпадают с первым символом обычного JSON,
+# поэтому ключи, записанные до появления кодеков, читаются как JSON без заголовка.
+JSON = 0x01
+ORJSON = 0x02
+MSGPACK = 0x03
+LZ4 = 0x40
+ZSTD = 0x80
+CODEC_MASK = 0x3F
+
+CODECS = {"json": JSON, "orjson": ORJSON, "msgpack": MSGPACK}
+COMPRESSIONS = {"none": 0, "lz4": LZ4, "zstd": ZSTD}
+
+# Какой пакет нужен для каждого формата/сжатия
+REQUIREMENTS = {
+    ORJSON: ("orjson", lambda: orjson),
+    MSGPACK: ("msgpack", lambda: msgpack),
+    LZ4: ("lz4", lambda: lz4_frame),
+    ZSTD: ("zstandard", lambda: zstandard),
+}
+
+
+def _require(flag):
+    """
+    Проверяет, что пакет для формата или сжатия установлен.
+    """
+    if flag in REQUIREMENTS:
+        package, module = REQUIREMENTS[flag]
+        if module() is None:
+            raise RuntimeError(
+                f"Для выбранного кодека нужен пакет {package}: pip install {package}"
+            )
+
+
+def _dumps(codec, value):
+    if codec == ORJSON:
+        return orjson.dumps(value)
+    if codec == MSGPACK:
+        return msgpack.packb(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _loads(codec, data):
+    if codec == ORJSON:
+        return orjson.loads(data)
+    if codec == MSGPACK:
+        return msgpack.unpackb(data)
+    return json.loads(data)
+
+
+def _compress(compression, data):
+    if compression == LZ4:
+        return lz4_frame.compress(data)
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _decompress(compression, data):
+    if compression == LZ4:
+        return lz4_frame.decompress(data)
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+# Сериализация значений кэша с заголовком формата и необязательным сжатием
+class ValueCodec:
+    def __init__(self, codec="json", compression="none", threshold=1024):
+        """
+        :param codec: Формат сериализации: "json", "orjson" или "msgpack".
+        :param compression: Сжатие: "none", "lz4" или "zstd".
+        :param threshold: Сжимать только значения не меньше этого размера в байтах.
+        """
+        self.codec = CODECS[codec]
+        self.compression = COMPRESSIONS[compression]
+        self.threshold = threshold
+        _require(self.codec)
+        _require(self.compression)
+
+    def encode(self, value):
+        """
+        Сериализует значение в байты с однобайтовым заголовком.
+        :param value: JSON-совместимое значение.
+        :return: bytes.
+        """
+        header = self.codec
+        payload = _dumps(self.codec, value)
+        if self.compression and len(payload) >= self.threshold:
+            payload = _compress(self.compression, payload)
+            header |= self.compression
+        return bytes((header,)) + payload
+
+    def decode(self, data):
+        """
+        Восстанавливает значение по заголовку, независимо от текущих настроек кодека,
+        поэтому во время выкладки читаются значения, записанные любым форматом.
+        :param data: bytes или str из Redis.
+        :return: Значение.
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        header = data[0]
+        codec = header & CODEC_MASK
+        if codec not in (JSON, ORJSON, MSGPACK):
+            # Значение записано до появления кодеков — обычный JSON
+            return json.loads(data)
+
+        payload = data[1:]
+        compression = header & ~CODEC_MASK
+        if compression:
+            _require(compression)
+            payload = _decompress(compression, payload)
+        _require(codec)
+        return _loads(codec, payload)
@@ -1,10 +1,98 @@
 from app.config import settings
+from app.metrics import instrument_engine
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 DATABASE_URL = settings.DATABASE_URL
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+
+def _is_sqlite_memory(url):
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_url(url):
+    """
+    Дополняет URL параметрами драйвера для профиля "prod":
+    для asyncpg включает кэш подготовленных запросов.
+    :param url: Строка подключения.
+    :return: Объект URL.
+    """
+    url = make_url(url)
+    if (
+        settings.DB_PROFILE == "prod"
+        and url.get_driver_name() == "asyncpg"
+        and "prepared_statement_cache_size" not in url.query
+    ):
+        url = url.update_query_dict(
+            {
+                "prepared_statement_cache_size": str(
+                    settings.DB_PREPARED_STATEMENT_CACHE_SIZE
+                )
+            }
+        )
+    return url
+
+
+def engine_options(url):
+    """
+    Возвращает параметры create_async_engine для выбранного профиля (DB_PROFILE).
+    "dev": каждый SQL-запрос пишется в лог, остальное по умолчанию.
+    "prod": логирование выключено (оно синхронное и заметно тормозит запросы),
+    задан размер пула и кэша скомпилированных выражений.
+    """
+    if settings.DB_PROFILE == "dev":
+        return {"echo": True}
+
+    options = {
+        "echo": False,
+        # Скомпилированный SQL одинаковых запросов берётся из кэша, а не строится заново
+        "query_cache_size": settings.DB_QUERY_CACHE_SIZE,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+    # База SQLite в памяти работает на одном соединении, пул для неё не настраивается
+    if not _is_sqlite_memory(url):
+        if url.get_backend_name() == "sqlite":
+            # По умолчанию aiosqlite открывает файл заново на каждую сессию (NullPool),
+            # а PRAGMA пришлось бы выполнять при каждом открытии
+            options["poolclass"] = AsyncAdaptedQueuePool
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+        )
+    if url.get_backend_name() != "sqlite":
+        # Сетевые соединения могут быть разорваны сервером — проверяем перед выдачей
+        options["pool_pre_ping"] = True
+    return options
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Настраивает каждое новое соединение SQLite (профиль "prod"):
+    WAL позволяет читать во время записи, synchronous=NORMAL в режиме WAL
+    не теряет целостность и не вызывает fsync на каждый коммит,
+    busy_timeout заставляет ждать блокировку записи вместо ошибки "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+url = engine_url(DATABASE_URL)
+engine = create_async_engine(url, **engine_options(url))
+if settings.DB_PROFILE == "prod" and url.get_backend_name() == "sqlite":
+    event.listen(engine.sync_engine, "connect", apply_sqlite_pragmas)
+# Время каждого SQL-запроса попадает в метрику db_query_duration_seconds
+instrument_engine(engine)
 
 AsyncSessionLocal = sessionmaker(
     bind=engine, class_=AsyncSession, expire_on_commit=False
@@ -13,6 +101,56 @@ AsyncSessionLocal = sessionmaker(
 Base = declarative_base()
 
 
+def add_missing_columns(connection):
+    """
+    Добавляет в существующие таблицы столбцы, появившиеся в моделях позже:
+    create_all создаёт только отсутствующие таблицы. Добавляемые столбцы
+    должны иметь server_default, чтобы заполнились и уже имеющиеся строки.
+    Вызывается через run_sync после create_all.
+    """
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+
+
+def enable_sqlite_autoincrement(connection):
+    """
+    Пересоздаёт существующие таблицы SQLite, для которых в модели задан
+    sqlite_autoincrement, но которые были созданы без AUTOINCREMENT:
+    create_all не меняет уже созданные таблицы. Строки копируются с прежними ID,
+    счётчик sqlite_sequence продолжается с наибольшего из них.
+    Вызывается через run_sync после create_all.
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    for table in Base.metadata.sorted_tables:
+        if not table.dialect_options["sqlite"]["autoincrement"]:
+            continue
+        sql = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (table.name,),
+        ).scalar()
+        if sql is None or "AUTOINCREMENT" in sql.upper():
+            continue
+        old_name = f"{table.name}_without_autoincrement"
+        connection.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {old_name}")
+        # Индексы переезжают вместе с таблицей, их имена нужны новой таблице
+        for index in inspect(connection).get_indexes(old_name):
+            connection.exec_driver_sql(f"DROP INDEX {index['name']}")
+        table.create(connection)
+        columns = ", ".join(column.name for column in table.columns)
+        connection.exec_driver_sql(
+            f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old_name}"
+        )
+        connection.exec_driver_sql(f"DROP TABLE {old_name}")
+
+
 async def get_db():
     """
     Асинхронный генератор, возвращающий сессию базы данных.
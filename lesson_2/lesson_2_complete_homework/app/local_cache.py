@@ -0,0 +1,72 @@
+import time
+from collections import OrderedDict
+
+
+# Ограниченный кэш внутри процесса (LRU + TTL), который стоит перед Redis
+class LocalCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize  # Максимальное количество записей
+        self.ttl = ttl  # Время жизни записи в секундах
+        self._data = OrderedDict()  # key -> (value, момент истечения)
+        self.hits = 0  # Количество попаданий
+        self.misses = 0  # Количество промахов
+
+    def get(self, key):
+        """
+        Возвращает значение из локального кэша.
+        :param key: Ключ.
+        :return: Значение или None, если записи нет или она устарела.
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            # Запись устарела — удаляем её и считаем промахом
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        # Отмечаем запись как недавно использованную
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Сохраняет значение в локальном кэше.
+        При переполнении вытесняет самую давно использованную запись.
+        :param key: Ключ.
+        :param value: Значение.
+        :param ttl: Время жизни в секундах (по умолчанию — self.ttl).
+        """
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Удаляет запись из локального кэша, если она есть.
+        """
+        self._data.pop(key, None)
+
+    def clear(self):
+        """
+        Полностью очищает локальный кэш.
+        """
+        self._data.clear()
+
+    def stats(self):
+        """
+        Возвращает счётчики попаданий/промахов и текущий размер кэша.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
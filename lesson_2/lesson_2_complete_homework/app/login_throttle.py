@@ -0,0 +1,149 @@
+import uuid
+from typing import NamedTuple
+from app.config import settings
+from app.metrics import record_cache
+from app.redis_client import redis_client
+
+# Скользящее окно: ключ — отсортированное множество моментов неудачных попыток.
+# KEYS[1] — ключ счётчика; ARGV: окно (мс), лимит, 1 — засчитать попытку / 0 — только проверить,
+# уникальный идентификатор попытки.
+# Возвращает {разрешено (1/0), оставшиеся попытки, через сколько мс можно повторить}.
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local hit = ARGV[3] == "1"
+
+local t = redis.call("TIME")
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local key_type = redis.call("TYPE", key)["ok"]
+if key_type ~= "none" and key_type ~= "zset" then
+    redis.call("DEL", key)
+end
+
+redis.call("ZREMRANGEBYSCORE", key, "-inf", now - window)
+local count = redis.call("ZCARD", key)
+
+local function retry_after()
+    local oldest = redis.call("ZRANGE", key, 0, 0, "WITHSCORES")
+    return tonumber(oldest[2]) + window - now
+end
+
+if count >= limit then
+    return {0, 0, retry_after()}
+end
+
+if hit then
+    redis.call("ZADD", key, now, ARGV[4])
+    redis.call("PEXPIRE", key, window)
+    count = count + 1
+end
+
+local remaining = limit - count
+if remaining == 0 then
+    return {1, 0, retry_after()}
+end
+return {1, remaining, 0}
+"""
+
+# GCRA: ключ хранит теоретическое время прибытия (TAT) следующей попытки.
+# Аргументы и результат такие же, как у скользящего окна.
+GCRA_SCRIPT = """
+local key = KEYS[1]
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local hit = ARGV[3] == "1"
+local interval = math.ceil(window / limit)
+
+local t = redis.call("TIME")
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local key_type = redis.call("TYPE", key)["ok"]
+if key_type ~= "none" and key_type ~= "string" then
+    redis.call("DEL", key)
+end
+
+local tat = tonumber(redis.call("GET", key)) or now
+if tat < now then
+    tat = now
+end
+
+-- Следующая попытка допустима, если после неё TAT не уйдёт дальше, чем на окно вперёд
+local allow_at = tat + interval - window
+if now < allow_at then
+    return {0, 0, math.ceil(allow_at - now)}
+end
+
+if hit then
+    tat = tat + interval
+    redis.call("SET", key, tat, "PX", math.ceil(tat - now))
+end
+
+local remaining = math.floor((now + window - tat) / interval)
+if remaining <= 0 then
+    return {1, 0, math.ceil(tat + interval - window - now)}
+end
+return {1, remaining, 0}
+"""
+
+SCRIPTS = {
+    "sliding": SLIDING_WINDOW_SCRIPT,
+    "gcra": GCRA_SCRIPT,
+}
+
+
+# Результат проверки ограничения попыток входа
+class ThrottleResult(NamedTuple):
+    allowed: bool  # Можно ли выполнить попытку
+    remaining: int  # Сколько неудачных попыток осталось до блокировки
+    retry_after: float  # Через сколько секунд снимется блокировка (0 — не заблокирован)
+
+
+def throttle_key(username):
+    """
+    Возвращает ключ Redis со счётчиком неудачных попыток пользователя.
+    """
+    return f"failed:{username}"
+
+
+async def _run(username, hit):
+    result = await redis_client.run_script(
+        SCRIPTS[settings.LOGIN_THROTTLE_MODE],
+        keys=[throttle_key(username)],
+        args=[
+            settings.LOGIN_LOCKOUT_WINDOW * 1000,
+            settings.LOGIN_MAX_ATTEMPTS,
+            1 if hit else 0,
+            uuid.uuid4().hex,
+        ],
+    )
+    allowed, remaining, retry_after_ms = result
+    return ThrottleResult(bool(allowed), int(remaining), int(retry_after_ms) / 1000)
+
+
+async def check_login_allowed(username):
+    """
+    Проверяет, не заблокирован ли вход пользователя, не засчитывая попытку.
+    Вызывается до проверки пароля, поэтому правильные (в том числе одновременные)
+    входы лимит не расходуют.
+    В метриках: hit — у пользователя есть недавние неудачные попытки, miss — нет.
+    :param username: Логин пользователя.
+    :return: ThrottleResult.
+    """
+    result = await _run(username, hit=False)
+    has_failures = result.remaining < settings.LOGIN_MAX_ATTEMPTS
+    record_cache(throttle_key(username), "hit" if has_failures else "miss")
+    return result
+
+
+async def register_failed_login(username):
+    """
+    Атомарно засчитывает неудачную попытку входа, если лимит ещё не исчерпан.
+    Одновременные неверные попытки проходят check_login_allowed вместе, но
+    засчитываются по одной: попытки сверх лимита получают allowed=False,
+    и вызывающий код отвечает на них так же, как на заблокированный вход.
+    :param username: Логин пользователя.
+    :return: ThrottleResult после учёта попытки (allowed=False — лимит уже исчерпан).
+    """
+    return await _run(username, hit=True)
@@ -1,11 +1,20 @@
 from fastapi import FastAPI
 from app.routers.simple_router import router
 from contextlib import asynccontextmanager
-from app.database import engine, Base
+from app.database import engine, Base, add_missing_columns, enable_sqlite_autoincrement
 from app.redis_client import redis_client
+from app.config import settings
+from app.write_behind import write_behind
+from app.warmup import cache_warmer
+from app.search_index import SearchIndexConsumer, search_index_rebuilder
+from app.change_stream import change_stream
 from app.routers.auth_router import (
     router as authentifacate_router,
 )  # импорт всего пакета или конкретно auth_router
+from app.routers.admin_router import router as admin_router
+from app.routers.health_router import router as health_router
+from app.routers.metrics_router import router as metrics_router
+from app.metrics import MetricsMiddleware
 
 
 # Управление жизненным циклом приложения через lifespan
@@ -15,22 +24,61 @@ async def lifespan(app: FastAPI):
     Настройка жизненного цикла приложения:
     - Подключение к базе данных и создание таблиц.
     - Подключение и закрытие Redis.
+    - Фоновая запись в базу (write-behind), прогрев кэша и построение поискового индекса.
+    - Потребители потока изменений объектов.
     """
-    # Подключение к базе данных и создание таблиц, если их ещё нет
+    # Подключение к базе данных и создание таблиц, если их ещё нет,
+    # а в существующих таблицах — новых столбцов и AUTOINCREMENT для SQLite
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(add_missing_columns)
+        await conn.run_sync(enable_sqlite_autoincrement)
 
     # Подключение к Redis
     await redis_client.connect()
 
+    # Фоновая запись изменений объектов в базу (write-behind)
+    if settings.WRITE_BEHIND_ENABLED:
+        await write_behind.start()
+
+    # Прогрев кэша в фоне: до его завершения /health/ready отвечает 503
+    if settings.CACHE_WARMUP_ENABLED:
+        cache_warmer.start()
+    else:
+        cache_warmer.ready = True
+
+    # Потребители потока изменений: группы создаются до построения индекса,
+    # чтобы изменения, сделанные во время построения, не были пропущены
+    change_stream.register(SearchIndexConsumer())
+    if settings.CHANGE_STREAM_CONSUMERS_ENABLED:
+        await change_stream.start()
+
+    # Поисковый индекс строится в фоне, только если его ещё нет в Redis
+    await search_index_rebuilder.ensure_built()
+
     # Передача управления приложению
     yield
 
+    # Остановка незавершённого прогрева и перестроения индекса
+    await cache_warmer.stop()
+    await search_index_rebuilder.stop()
+
+    # Остановка потребителей: необработанные события остаются в потоке
+    await change_stream.stop()
+
+    # Остановка фоновой записи: неприменённые изменения остаются в Redis Stream
+    await write_behind.stop()
+
     # Закрытие подключения к Redis
     await redis_client.close()
 
 
 app = FastAPI(lifespan=lifespan)
+# Время обработки каждого запроса по маршруту (метрика http_request_duration_seconds)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(router)
 app.include_router(authentifacate_router)
+app.include_router(admin_router)
+app.include_router(health_router)
+app.include_router(metrics_router)
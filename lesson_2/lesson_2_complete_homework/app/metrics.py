@@ -0,0 +1,213 @@
+import bisect
+import time
+from sqlalchemy import event
+
+# Границы корзин гистограмм задержек в секундах
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+# Все метрики приложения в порядке регистрации (для выдачи в /metrics)
+REGISTRY = []
+
+
+def _escape(value):
+    """
+    Экранирует значение метки по правилам текстового формата Prometheus.
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# Счётчик, растущий только вверх (например, количество попаданий в кэш)
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}  # значения меток -> счётчик
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount=1):
+        """
+        Увеличивает счётчик с указанными значениями меток.
+        """
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        for labels, value in self._values.items():
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            )
+        return lines
+
+
+# Гистограмма распределения значений (например, задержек) по корзинам
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # значения меток -> [счётчики корзин, сумма, количество]
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        """
+        Учитывает одно наблюдение. Стоимость — поиск корзины и три сложения,
+        накопительные суммы по корзинам считаются только при выдаче метрик.
+        """
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{_format_labels(self.labelnames, labels, le)} {cumulative}"
+                )
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+def render():
+    """
+    Возвращает все метрики в текстовом формате Prometheus (version 0.0.4).
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+redis_command_duration = Histogram(
+    "redis_command_duration_seconds",
+    "Время выполнения команд Redis (конвейер считается одной командой)",
+    ("command",),
+)
+cache_requests = Counter(
+    "cache_requests_total",
+    "Обращения к кэшу по префиксу ключа: hit, miss или negative (объекта нет)",
+    ("prefix", "result"),
+)
+db_query_duration = Histogram(
+    "db_query_duration_seconds",
+    "Время выполнения SQL-запросов по типу оператора",
+    ("operation",),
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запросов по маршруту",
+    ("method", "route", "status"),
+)
+
+
+def key_prefix(key):
+    """
+    Возвращает префикс ключа Redis до первого двоеточия ("item:42" -> "item"),
+    чтобы число значений метки не росло вместе с числом ключей.
+    """
+    return key.partition(":")[0]
+
+
+def record_cache(key, result):
+    """
+    Учитывает обращение к кэшу.
+    :param key: Ключ Redis.
+    :param result: "hit", "miss" или "negative".
+    """
+    cache_requests.inc(key_prefix(key), result)
+
+
+def instrument_engine(engine):
+    """
+    Подключает к движку SQLAlchemy обработчики событий, измеряющие время каждого запроса.
+    :param engine: AsyncEngine или Engine.
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement else ""
+        db_query_duration.observe(time.perf_counter() - started, operation)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        # Запрос завершился ошибкой — снимаем его отметку времени
+        started = (
+            context.connection.info.get("query_started") if context.connection else None
+        )
+        if started:
+            started.pop()
+
+
+# ASGI-middleware: время обработки запросов по шаблону маршрута ("/items/{item_id}")
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Маршрут известен только после маршрутизации; неизвестные пути
+            # объединяем, чтобы перебор URL не плодил новые ряды метрик
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                status["code"],
+            )
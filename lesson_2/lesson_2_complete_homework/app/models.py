@@ -4,10 +4,16 @@ from app.database import Base
 
 class Item(Base):
     __tablename__ = "items"
+    # Без AUTOINCREMENT SQLite может выдать ID удалённого объекта повторно,
+    # и новый объект с версией 1 окажется старше записи об удалении в кэше
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     description = Column(String, index=True)
+    # Версия строки: растёт при каждом изменении, по ней кэш отличает
+    # новые данные от устаревших
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
 
 # BEGIN YOUR SOLUTION HERE
@@ -0,0 +1,79 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+from app.config import settings
+
+# Создаем контекст для хэширования паролей с использованием bcrypt
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt освобождает GIL на время вычисления, поэтому потоков достаточно,
+# чтобы хэширование шло параллельно и не блокировало цикл событий
+_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+# Одновременно в пуле выполняется не больше PASSWORD_HASH_WORKERS операций
+_slots = asyncio.Semaphore(settings.PASSWORD_HASH_WORKERS)
+_waiting = 0  # Сколько запросов ждут свободный слот
+_running = 0  # Сколько операций выполняется в пуле
+
+
+# Исключение: очередь на хэширование переполнена, запрос нужно повторить позже
+class PasswordHashingBusy(Exception):
+    pass
+
+
+async def _run(func, *args):
+    """
+    Выполняет func в пуле потоков с ограничением очереди.
+    Если ожидающих больше PASSWORD_HASH_MAX_QUEUE или слот не освободился
+    за PASSWORD_HASH_QUEUE_TIMEOUT секунд, выбрасывает PasswordHashingBusy.
+    """
+    global _waiting, _running
+    if _slots.locked() and _waiting >= settings.PASSWORD_HASH_MAX_QUEUE:
+        raise PasswordHashingBusy()
+
+    _waiting += 1
+    try:
+        await asyncio.wait_for(_slots.acquire(), settings.PASSWORD_HASH_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise PasswordHashingBusy() from None
+    finally:
+        _waiting -= 1
+
+    _running += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, func, *args)
+    finally:
+        _running -= 1
+        _slots.release()
+
+
+async def hash_password(password):
+    """
+    Хэширует пароль вне цикла событий.
+    :param password: Пароль в открытом виде.
+    :return: Хэш пароля.
+    """
+    return await _run(pwd_context.hash, password)
+
+
+async def verify_password(password, hashed_password):
+    """
+    Проверяет пароль по хэшу вне цикла событий.
+    :param password: Пароль в открытом виде.
+    :param hashed_password: Сохранённый хэш.
+    :return: True, если пароль верный.
+    """
+    return await _run(pwd_context.verify, password, hashed_password)
+
+
+def stats():
+    """
+    Возвращает загрузку пула хэширования: занятые слоты и длину очереди.
+    """
+    return {
+        "workers": settings.PASSWORD_HASH_WORKERS,
+        "running": _running,
+        "waiting": _waiting,
+    }
@@ -1,30 +1,291 @@
+import asyncio
+import logging
+import math
+import time
 import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
 from app.config import settings
+from app.codecs import ValueCodec
+from app.local_cache import LocalCache
+from app.metrics import redis_command_duration
+
+logger = logging.getLogger("redis_client")
+
+# Снимает блокировку, только если она всё ещё принадлежит владельцу токена
+RELEASE_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+# Регистрирует ключ KEYS[1] в множествах тегов KEYS[3..] (фрагмент скриптов записи).
+# Множество тега живёт не меньше самого долгоживущего из своих ключей:
+# TTL задаётся, если его нет, и только продлевается. Сравнение TTL выполняется
+# в скрипте, а не через EXPIRE NX/GT, которые есть только в Redis 7+
+TAG_KEYS_LUA = """
+local tag_ttl = math.ceil(tonumber(ARGV[2]) / 1000)
+for i = 3, #KEYS do
+    redis.call("SADD", KEYS[i], KEYS[1])
+    if redis.call("TTL", KEYS[i]) < tag_ttl then
+        redis.call("EXPIRE", KEYS[i], tag_ttl)
+    end
+end
+"""
+
+# Регистрирует ключ KEYS[1] в множествах тегов KEYS[2..] так же, как TAG_KEYS_LUA.
+# ARGV[1] — TTL ключа в секундах или пустая строка для ключа без TTL
+# (тогда и множество тега не истекает)
+ADD_TAGS_SCRIPT = """
+local ttl = tonumber(ARGV[1])
+for i = 2, #KEYS do
+    redis.call("SADD", KEYS[i], KEYS[1])
+    if not ttl then
+        redis.call("PERSIST", KEYS[i])
+    elseif redis.call("TTL", KEYS[i]) < ttl then
+        redis.call("EXPIRE", KEYS[i], ttl)
+    end
+end
+return 1
+"""
+
+# Записывает значение вместе с версией данных, из которых оно построено (ключ <key>:ver).
+# KEYS: ключ значения, ключ версии, множества тегов. ARGV: значение, TTL в миллисекундах,
+# версия, режим:
+# "cas" — запись не старее сохранённой (меньшая версия отклоняется),
+# "nx" — только если значения ещё нет, "force" — безусловно.
+# Если ключа версии нет (значение старого формата), любая версия считается новее
+VERSIONED_SET_SCRIPT = (
+    """
+local mode = ARGV[4]
+if mode ~= "force" and redis.call("EXISTS", KEYS[1]) == 1 then
+    if mode == "nx" then
+        return 0
+    end
+    local current = tonumber(redis.call("GET", KEYS[2]) or "-1")
+    if current > tonumber(ARGV[3]) then
+        return 0
+    end
+end
+redis.call("SET", KEYS[1], ARGV[1], "PX", ARGV[2])
+redis.call("SET", KEYS[2], ARGV[3], "PX", ARGV[2])
+"""
+    + TAG_KEYS_LUA
+    + """
+return 1
+"""
+)
+
+# Записывает готовый ответ хэшем {body, etag}: ETag читается отдельно от тела (HGET).
+# Если задана версия (ARGV[4]), ответ записывается, только если версия значения,
+# из которого он построен, не старше текущей версии в KEYS[2].
+# KEYS: ключ ответа, ключ версии исходного значения, множества тегов.
+# ARGV: тело, TTL в миллисекундах, ETag, версия (или пустая строка)
+SET_RESPONSE_SCRIPT = (
+    """
+if ARGV[4] ~= "" then
+    local current = redis.call("GET", KEYS[2])
+    if current and tonumber(current) > tonumber(ARGV[4]) then
+        return 0
+    end
+end
+redis.call("DEL", KEYS[1])
+redis.call("HSET", KEYS[1], "body", ARGV[1], "etag", ARGV[3])
+redis.call("PEXPIRE", KEYS[1], ARGV[2])
+"""
+    + TAG_KEYS_LUA
+    + """
+return 1
+"""
+)
+
+
+def tag_key(tag):
+    """
+    Возвращает ключ множества, в котором хранятся ключи, помеченные тегом.
+    """
+    return f"tag:{tag}"
+
+
+def version_key(key):
+    """
+    Возвращает ключ, в котором хранится версия значения key.
+    """
+    return f"{key}:ver"
+
+
+# Блокирующий пул соединений со статистикой ожидания
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.waits = 0  # Сколько раз пришлось ждать свободное соединение
+        self.acquired = 0  # Сколько раз соединение было выдано
+        self.acquire_time_total = 0.0  # Суммарное время получения соединения
+        self.acquire_time_max = 0.0  # Максимальное время получения соединения
+
+    async def get_connection(self, command_name, *keys, **options):
+        """
+        Выдаёт соединение из пула и учитывает время ожидания.
+        Если все соединения заняты, ждёт не дольше REDIS_POOL_TIMEOUT.
+        """
+        if not self.can_get_connection():
+            self.waits += 1
+        started = time.perf_counter()
+        connection = await super().get_connection(command_name, *keys, **options)
+        elapsed = time.perf_counter() - started
+        self.acquired += 1
+        self.acquire_time_total += elapsed
+        self.acquire_time_max = max(self.acquire_time_max, elapsed)
+        return connection
+
+    def in_use(self):
+        """
+        Возвращает количество занятых соединений.
+        """
+        return len(self._in_use_connections)
+
+    def stats(self):
+        """
+        Возвращает статистику пула: занятые и свободные соединения, ожидания и время получения.
+        """
+        return {
+            "max_connections": self.max_connections,
+            "in_use": self.in_use(),
+            "idle": len(self._available_connections),
+            "waits": self.waits,
+            "acquired": self.acquired,
+            "acquire_avg_ms": (
+                self.acquire_time_total / self.acquired * 1000 if self.acquired else 0.0
+            ),
+            "acquire_max_ms": self.acquire_time_max * 1000,
+        }
+
+
+# Клиент Redis, измеряющий время выполнения каждой команды
+class InstrumentedRedis(redis.Redis):
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            redis_command_duration.observe(
+                time.perf_counter() - started, str(args[0]).upper()
+            )
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+# Конвейер, время выполнения которого учитывается как одна команда PIPELINE/MULTI
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error=True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            redis_command_duration.observe(
+                time.perf_counter() - started,
+                "MULTI" if self.is_transaction else "PIPELINE",
+            )
 
 
 # Класс для управления подключением к Redis
 class RedisClient:
     def __init__(self):
         self.redis = None  # Поле для хранения экземпляра клиента Redis
+        self.pool = None  # Пул соединений
+        # Клиент без декодирования ответов: значения кэша хранятся в бинарном виде
+        self.redis_binary = None
+        self.binary_pool = None  # Пул соединений бинарного клиента
+        self.codec = None  # Кодек значений кэша
+        self.local_cache = None  # Локальный кэш процесса (L1), если включён
+        self._invalidation_task = None  # Фоновая задача подписки на инвалидации
+        self._closing = False  # Идёт остановка: подписка на инвалидации завершается
+        self._scripts = {}  # Зарегистрированные Lua-скрипты: исходный код -> Script
+        self.redis_hits = 0  # Попадания в Redis (L2)
+        self.redis_misses = 0  # Промахи в Redis (L2)
 
     async def connect(self):
         """
         Устанавливает подключение к Redis с параметрами из настроек.
+        Соединения берутся из ограниченного блокирующего пула.
+        Значения кэша читаются отдельным клиентом без декодирования ответов.
+        Если включён L1-кэш, запускает подписку на канал инвалидаций.
         """
-        self.redis = redis.Redis(
+        self.codec = ValueCodec(
+            codec=settings.CACHE_CODEC,
+            compression=settings.CACHE_COMPRESSION,
+            threshold=settings.CACHE_COMPRESSION_THRESHOLD,
+        )
+        self.pool = self._make_pool(decode_responses=True)
+        self.redis = InstrumentedRedis(connection_pool=self.pool)
+        self.binary_pool = self._make_pool(decode_responses=False)
+        self.redis_binary = InstrumentedRedis(connection_pool=self.binary_pool)
+        self._scripts = {}
+
+        if settings.L1_CACHE_ENABLED:
+            self.local_cache = LocalCache(
+                maxsize=settings.L1_CACHE_MAXSIZE, ttl=settings.L1_CACHE_TTL
+            )
+            self._closing = False
+            self._invalidation_task = asyncio.create_task(self._listen_invalidations())
+
+    def _make_pool(self, decode_responses):
+        """
+        Создаёт пул соединений с параметрами из настроек.
+        :param decode_responses: Декодировать ли ответы Redis в строки.
+        """
+        return InstrumentedConnectionPool(
             host=settings.REDIS_HOST,  # Хост Redis-сервера
             port=settings.REDIS_PORT,  # Порт Redis-сервера
             db=settings.REDIS_DB,  # Номер базы в Redis
             password=settings.REDIS_PASSWORD,  # Пароль для подключения (если требуется)
-            decode_responses=True,  # Автоматическое декодирование ответов
+            decode_responses=decode_responses,  # Декодирование ответов
+            max_connections=settings.REDIS_MAX_CONNECTIONS,  # Ограничение размера пула
+            timeout=settings.REDIS_POOL_TIMEOUT,  # Ожидание свободного соединения
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,  # Таймаут операций
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,  # Таймаут подключения
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,  # Проверка соединений
         )
 
     async def close(self):
         """
         Закрывает соединение с Redis, если оно существует.
+        Останавливает подписку на инвалидации, ждёт (не дольше REDIS_SHUTDOWN_TIMEOUT),
+        пока выполняющиеся команды вернут соединения в пул, и закрывает все соединения.
         """
+        if self._invalidation_task:
+            self._closing = True
+            self._invalidation_task.cancel()
+            try:
+                await asyncio.wait_for(
+                    self._invalidation_task, settings.REDIS_SHUTDOWN_TIMEOUT
+                )
+            except asyncio.CancelledError:
+                pass
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "Подписка на инвалидации не остановилась за %s с",
+                    settings.REDIS_SHUTDOWN_TIMEOUT,
+                )
+            self._invalidation_task = None
+
         if self.redis:
-            self.redis.close()  # Закрытие соединения
+            deadline = time.monotonic() + settings.REDIS_SHUTDOWN_TIMEOUT
+            while (
+                self.pool.in_use() or self.binary_pool.in_use()
+            ) and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            for client, pool in (
+                (self.redis, self.pool),
+                (self.redis_binary, self.binary_pool),
+            ):
+                await client.aclose()  # Закрытие клиента
+                await pool.disconnect()  # Закрытие всех соединений пула
+            self.redis = self.redis_binary = None
+            self.pool = self.binary_pool = None
 
     async def get(self, key):
         """
@@ -52,6 +313,500 @@ class RedisClient:
         """
         return await self.redis.delete(key)
 
+    async def mget(self, keys):
+        """
+        Получает значения нескольких ключей одной командой MGET.
+        :param keys: Список ключей.
+        :return: Список значений в том же порядке (None для отсутствующих ключей).
+        """
+        return await self.redis.mget(keys)
+
+    async def mset_with_ttl(self, mapping, ex=None):
+        """
+        Устанавливает несколько ключей с TTL за один сетевой запрос (конвейер SET).
+        MSET не поддерживает TTL, поэтому используется pipeline без транзакции.
+        :param mapping: Словарь ключ -> значение.
+        :param ex: Время жизни ключей в секундах (TTL).
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, value in mapping.items():
+                pipe.set(key, value, ex=ex)
+            return await pipe.execute()
+
+    def pipeline(self):
+        """
+        Возвращает конвейер команд без транзакции.
+        Команды накапливаются локально и отправляются в Redis одним запросом.
+        Пример:
+            async with redis_client.pipeline() as pipe:
+                pipe.incr("counter")
+                pipe.expire("counter", 60)
+                value, _ = await pipe.execute()
+        """
+        return self.redis.pipeline(transaction=False)
+
+    def transaction(self):
+        """
+        Возвращает конвейер команд, выполняемых атомарно (MULTI/EXEC) за один запрос.
+        Используется так же, как pipeline().
+        """
+        return self.redis.pipeline(transaction=True)
+
+    async def incr(self, key):
+        """
+        Атомарно увеличивает числовое значение ключа на 1.
+        :param key: Ключ.
+        :return: Новое значение.
+        """
+        return await self.redis.incr(key)
+
+    async def get_cached(self, key):
+        """
+        Получает значение через двухуровневый кэш: сначала L1 процесса, затем Redis.
+        Значение, найденное в Redis, кладётся в L1.
+        :param key: Ключ.
+        :return: Десериализованное значение либо None.
+        """
+        if self.local_cache is not None:
+            value = self.local_cache.get(key)
+            if value is not None:
+                return value
+
+        data = await self.redis_binary.get(key)
+        if data is None:
+            self.redis_misses += 1
+            return None
+
+        self.redis_hits += 1
+        value = self.codec.decode(data)
+        if self.local_cache is not None:
+            self.local_cache.set(key, value)
+        return value
+
+    async def mget_cached(self, keys):
+        """
+        Получает несколько значений: сначала из L1, остальные одним MGET из Redis.
+        :param keys: Список ключей.
+        :return: Словарь ключ -> значение только для найденных ключей.
+        """
+        found = {}
+        remote_keys = []
+        for key in keys:
+            value = self.local_cache.get(key) if self.local_cache is not None else None
+            if value is not None:
+                found[key] = value
+            else:
+                remote_keys.append(key)
+
+        if remote_keys:
+            raws = await self.redis_binary.mget(remote_keys)
+            for key, raw in zip(remote_keys, raws):
+                if raw is None:
+                    self.redis_misses += 1
+                    continue
+                self.redis_hits += 1
+                found[key] = self.codec.decode(raw)
+                if self.local_cache is not None:
+                    self.local_cache.set(key, found[key])
+        return found
+
+    async def mset_cached(self, mapping, ex=None, broadcast=False):
+        """
+        Сохраняет несколько значений одним конвейером SET.
+        :param mapping: Словарь ключ -> значение.
+        :param ex: Время жизни ключей в секундах (TTL).
+        :param broadcast: False — кэш заполняется после чтения из БД, значения кладутся в свой L1;
+                          True — значения изменились, инвалидации L1 рассылаются
+                          в том же конвейере.
+        """
+        if broadcast and self.local_cache is not None:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, value in mapping.items():
+                    pipe.set(key, self.codec.encode(value), ex=ex)
+                    pipe.publish(settings.CACHE_INVALIDATION_CHANNEL, key)
+                    self.local_cache.delete(key)
+                await pipe.execute()
+            return
+
+        await self.mset_with_ttl(
+            {key: self.codec.encode(value) for key, value in mapping.items()}, ex=ex
+        )
+        if not broadcast and self.local_cache is not None:
+            for key, value in mapping.items():
+                self.local_cache.set(key, value)
+
+    async def set_cached(self, key, value, ex=None, broadcast=True, tags=()):
+        """
+        Сохраняет значение в Redis в формате, заданном CACHE_CODEC.
+        :param key: Ключ.
+        :param value: JSON-совместимое значение.
+        :param ex: Время жизни ключа в секундах (TTL).
+        :param broadcast: True — значение изменилось, рассылаем инвалидацию L1 всем процессам;
+                          False — кэш заполняется после чтения из БД, кладём значение в свой L1.
+        :param tags: Теги ключа для совместной инвалидации (invalidate_tag).
+                     Ключ регистрируется в тегах в том же конвейере перед записью.
+        """
+        data = self.codec.encode(value)
+        if tags:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                await self._add_tags(pipe, key, tags, ex)
+                pipe.set(key, data, ex=ex)
+                await pipe.execute()
+        else:
+            await self.redis.set(key, data, ex=ex)
+        if broadcast:
+            await self.publish_invalidation(key)
+        elif self.local_cache is not None:
+            self.local_cache.set(key, value)
+
+    async def set_versioned(
+        self, key, value, version, ex, mode="cas", broadcast=True, tags=()
+    ):
+        """
+        Сохраняет значение с версией одним вызовом VERSIONED_SET_SCRIPT:
+        значение, прочитанное из базы до обновления, не затирает в кэше обновлённое,
+        даже если запись в кэш дошла позже.
+        :param key: Ключ.
+        :param value: JSON-совместимое значение.
+        :param version: Версия данных (целое число, растущее с каждым изменением).
+        :param ex: Время жизни ключа в секундах (TTL).
+        :param mode: "cas", "nx" или "force" (см. VERSIONED_SET_SCRIPT).
+        :param broadcast: То же, что у set_cached.
+        :param tags: То же, что у set_cached (регистрация в тегах — в том же скрипте).
+        :return: True, если значение записано.
+        """
+        stored = bool(
+            await self.run_script(
+                VERSIONED_SET_SCRIPT,
+                keys=[key, version_key(key), *map(tag_key, tags)],
+                args=[self.codec.encode(value), int(ex * 1000), version, mode],
+            )
+        )
+        if stored:
+            if broadcast:
+                await self.publish_invalidation(key)
+            elif self.local_cache is not None:
+                self.local_cache.set(key, value)
+        return stored
+
+    async def mset_versioned(self, mapping, ex, mode="cas", broadcast=False):
+        """
+        Сохраняет несколько значений с версиями одним конвейером вызовов
+        VERSIONED_SET_SCRIPT.
+        :param mapping: Словарь ключ -> (значение, версия).
+        :param ex: Время жизни ключей в секундах (TTL).
+        :param mode: "cas", "nx" или "force" (см. VERSIONED_SET_SCRIPT).
+        :param broadcast: То же, что у mset_cached.
+        :return: Список ключей, значения которых записаны.
+        """
+        script = self.script(VERSIONED_SET_SCRIPT)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, (value, version) in mapping.items():
+                await script(
+                    keys=[key, version_key(key)],
+                    args=[self.codec.encode(value), int(ex * 1000), version, mode],
+                    client=pipe,
+                )
+            results = await pipe.execute()
+
+        stored = [key for key, result in zip(mapping, results) if result]
+        if self.local_cache is not None:
+            if broadcast:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for key in stored:
+                        self.local_cache.delete(key)
+                        pipe.publish(settings.CACHE_INVALIDATION_CHANNEL, key)
+                    await pipe.execute()
+            else:
+                for key in stored:
+                    self.local_cache.set(key, mapping[key][0])
+        return stored
+
+    async def get_response(self, key):
+        """
+        Получает готовый ответ: сначала из L1, затем одним HMGET из Redis.
+        Значение, найденное в Redis, кладётся в L1.
+        :param key: Ключ ответа.
+        :return: Словарь {"body": байты, "etag": строка} или None.
+        """
+        if self.local_cache is not None:
+            value = self.local_cache.get(key)
+            if value is not None:
+                return value
+
+        try:
+            body, etag = await self.redis_binary.hmget(key, ["body", "etag"])
+        except redis.ResponseError:
+            # Ключ старого формата (строка): считаем промахом, он будет перезаписан
+            body = None
+        if body is None:
+            self.redis_misses += 1
+            return None
+
+        self.redis_hits += 1
+        value = {"body": body, "etag": etag.decode()}
+        if self.local_cache is not None:
+            self.local_cache.set(key, value)
+        return value
+
+    async def get_response_etag(self, key):
+        """
+        Получает только ETag готового ответа (L1 или HGET одного поля),
+        не читая тело из Redis.
+        :param key: Ключ ответа.
+        :return: ETag или None, если ответа нет в кэше.
+        """
+        if self.local_cache is not None:
+            value = self.local_cache.get(key)
+            if value is not None:
+                return value["etag"]
+        try:
+            return await self.redis.hget(key, "etag")
+        except redis.ResponseError:
+            return None
+
+    async def set_response(
+        self, key, body, etag, ex, version_of=None, version=None, tags=()
+    ):
+        """
+        Сохраняет готовый ответ вместе с его ETag одним вызовом SET_RESPONSE_SCRIPT
+        и кладёт его в свой L1, как set_cached(broadcast=False).
+        Если задана версия, ответ, построенный из версии version значения version_of,
+        сохраняется, только если та за это время не обновилась.
+        :param key: Ключ ответа.
+        :param body: Тело ответа (байты).
+        :param etag: ETag тела.
+        :param ex: Время жизни ключа в секундах (TTL).
+        :param version_of: Ключ исходного значения, версию которого нужно проверить.
+        :param version: Версия исходного значения (None — без проверки).
+        :param tags: То же, что у set_cached (регистрация в тегах — в том же скрипте).
+        :return: True, если ответ записан.
+        """
+        stored = bool(
+            await self.run_script(
+                SET_RESPONSE_SCRIPT,
+                keys=[key, version_key(version_of or key), *map(tag_key, tags)],
+                args=[
+                    body,
+                    int(ex * 1000),
+                    etag,
+                    "" if version is None else version,
+                ],
+            )
+        )
+        if stored and self.local_cache is not None:
+            self.local_cache.set(key, {"body": body, "etag": etag})
+        return stored
+
+    async def _add_tags(self, pipe, key, tags, ex):
+        """
+        Добавляет в конвейер регистрацию ключа в множествах тегов (ADD_TAGS_SCRIPT).
+        """
+        await self.script(ADD_TAGS_SCRIPT)(
+            keys=[key, *map(tag_key, tags)],
+            args=["" if ex is None else math.ceil(ex)],
+            client=pipe,
+        )
+
+    async def invalidate_tag(self, tag, max_keys=None):
+        """
+        Удаляет ключи, помеченные тегом, из Redis и из L1-кэшей всех процессов.
+        Ключи извлекаются из множества тега порциями по CACHE_TAG_CHUNK_SIZE (SPOP,
+        поэтому одновременные вызовы не удаляют одно и то же), и каждая порция
+        удаляется одним конвейером DEL вместе с рассылкой инвалидаций L1.
+        Заодно из множества уходят и ключи, которые уже истекли.
+        За вызов обрабатывается не больше max_keys ключей: остаток удалит
+        следующий вызов или истечение TTL.
+        :param tag: Тег.
+        :param max_keys: Предел ключей за вызов (по умолчанию CACHE_TAG_MAX_KEYS).
+        :return: {"deleted": удалено ключей, "remaining": осталось в теге}.
+        """
+        max_keys = max_keys if max_keys is not None else settings.CACHE_TAG_MAX_KEYS
+        deleted = 0
+        processed = 0
+        while processed < max_keys:
+            keys = await self.redis.spop(
+                tag_key(tag), min(settings.CACHE_TAG_CHUNK_SIZE, max_keys - processed)
+            )
+            if not keys:
+                return {"deleted": deleted, "remaining": 0}
+            processed += len(keys)
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.delete(*keys)
+                if self.local_cache is not None:
+                    for key in keys:
+                        self.local_cache.delete(key)
+                        pipe.publish(settings.CACHE_INVALIDATION_CHANNEL, key)
+                deleted += (await pipe.execute())[0]
+        return {"deleted": deleted, "remaining": await self.redis.scard(tag_key(tag))}
+
+    async def prune_tag(self, tag, cursor=0, max_keys=None):
+        """
+        Удаляет из множества тега ключи, которые уже истекли или были удалены
+        без invalidate_tag, чтобы множество долго живущего тега не росло.
+        Проверяет около max_keys ключей за вызов (SSCAN порциями
+        по CACHE_TAG_CHUNK_SIZE, EXISTS одним конвейером на порцию;
+        COUNT у SSCAN — лишь подсказка, поэтому порция может быть больше).
+        :param tag: Тег.
+        :param cursor: Курсор SSCAN, с которого продолжить (0 — с начала).
+        :param max_keys: Предел проверяемых ключей (по умолчанию CACHE_TAG_MAX_KEYS).
+        :return: {"cursor": курсор для следующего вызова (0 — множество пройдено),
+                  "checked": проверено ключей, "removed": удалено из тега}.
+        """
+        max_keys = max_keys if max_keys is not None else settings.CACHE_TAG_MAX_KEYS
+        checked = 0
+        removed = 0
+        while True:
+            cursor, keys = await self.redis.sscan(
+                tag_key(tag), cursor, count=settings.CACHE_TAG_CHUNK_SIZE
+            )
+            if keys:
+                checked += len(keys)
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for key in keys:
+                        pipe.exists(key)
+                    exists = await pipe.execute()
+                missing = [key for key, found in zip(keys, exists) if not found]
+                if missing:
+                    removed += await self.redis.srem(tag_key(tag), *missing)
+            if cursor == 0 or checked >= max_keys:
+                return {"cursor": cursor, "checked": checked, "removed": removed}
+
+    async def tag_stats(self, tag):
+        """
+        Возвращает количество ключей в теге (включая ещё не вычищенные истёкшие)
+        и оставшееся время жизни множества тега в секундах.
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.scard(tag_key(tag))
+            pipe.ttl(tag_key(tag))
+            size, ttl = await pipe.execute()
+        return {"tag": tag, "keys": size, "ttl": ttl}
+
+    async def invalidate(self, key):
+        """
+        Удаляет ключ из Redis и из L1-кэшей всех процессов.
+        :param key: Ключ.
+        :return: Количество удалённых ключей в Redis (0 или 1).
+        """
+        deleted = await self.redis.delete(key)
+        await self.publish_invalidation(key)
+        return deleted
+
+    async def invalidate_many(self, keys):
+        """
+        Удаляет несколько ключей одним конвейером: из Redis, из множеств их тегов
+        и из L1-кэшей всех процессов.
+        :param keys: Словарь ключ -> теги, в которых ключ зарегистрирован.
+        :return: Количество удалённых ключей в Redis.
+        """
+        if not keys:
+            return 0
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.delete(*keys)
+            for key, tags in keys.items():
+                for tag in tags:
+                    pipe.srem(tag_key(tag), key)
+                if self.local_cache is not None:
+                    self.local_cache.delete(key)
+                    pipe.publish(settings.CACHE_INVALIDATION_CHANNEL, key)
+            return (await pipe.execute())[0]
+
+    async def publish_invalidation(self, key):
+        """
+        Удаляет ключ из собственного L1 и публикует его в канал инвалидаций,
+        чтобы остальные процессы тоже сбросили устаревшую запись.
+        """
+        if self.local_cache is None:
+            return
+        self.local_cache.delete(key)
+        await self.redis.publish(settings.CACHE_INVALIDATION_CHANNEL, key)
+
+    async def _listen_invalidations(self):
+        """
+        Фоновая задача: слушает канал инвалидаций и удаляет ключи из L1.
+        При потере соединения очищает L1 целиком, так как сообщения могли быть пропущены.
+        Цикл проверяет флаг остановки: отмена задачи, пришедшая во время ожидания
+        сообщения с таймаутом, может быть поглощена внутри get_message.
+        """
+        while not self._closing:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(settings.CACHE_INVALIDATION_CHANNEL)
+                while not self._closing:
+                    # Ожидание с таймаутом меньше socket_timeout: listen() при тишине в канале
+                    # падал бы по таймауту сокета, а get_message заодно выполняет health check
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=1.0
+                    )
+                    if message and message["type"] == "message":
+                        self.local_cache.delete(message["data"])
+            except (redis.ConnectionError, redis.TimeoutError):
+                logger.warning("Потеряно соединение с каналом инвалидаций, L1 очищен")
+                self.local_cache.clear()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    async def acquire_lock(self, name, token, px):
+        """
+        Пытается взять короткую блокировку (SET NX PX).
+        :param name: Ключ блокировки.
+        :param token: Уникальный токен владельца.
+        :param px: Время жизни блокировки в миллисекундах.
+        :return: True, если блокировка получена.
+        """
+        return bool(await self.redis.set(name, token, nx=True, px=px))
+
+    async def release_lock(self, name, token):
+        """
+        Снимает блокировку, если она принадлежит владельцу токена.
+        :return: True, если блокировка была снята.
+        """
+        return bool(
+            await self.run_script(RELEASE_LOCK_SCRIPT, keys=[name], args=[token])
+        )
+
+    async def run_script(self, source, keys=(), args=()):
+        """
+        Выполняет Lua-скрипт атомарно на стороне Redis.
+        Скрипт регистрируется один раз и вызывается по SHA1 через EVALSHA
+        (если Redis его не знает, например после перезапуска, он загружается заново).
+        :param source: Исходный код скрипта.
+        :param keys: Ключи (KEYS).
+        :param args: Аргументы (ARGV).
+        :return: Результат скрипта.
+        """
+        return await self.script(source)(keys=list(keys), args=list(args))
+
+    def script(self, source):
+        """
+        Возвращает зарегистрированный объект Script для исходного кода скрипта.
+        Вызов с client=<конвейер> добавляет скрипт в конвейер:
+            await redis_client.script(source)(keys=[...], args=[...], client=pipe)
+        """
+        script = self._scripts.get(source)
+        if script is None:
+            script = self._scripts[source] = self.redis.register_script(source)
+        return script
+
+    def pool_stats(self):
+        """
+        Возвращает статистику пула соединений Redis.
+        """
+        if self.pool is None:
+            return None
+        return {"text": self.pool.stats(), "binary": self.binary_pool.stats()}
+
+    def cache_stats(self):
+        """
+        Возвращает счётчики попаданий/промахов для каждого уровня кэша.
+        """
+        return {
+            "l1": self.local_cache.stats() if self.local_cache is not None else None,
+            "redis": {"hits": self.redis_hits, "misses": self.redis_misses},
+        }
+
 
 # Создаём экземпляр клиента Redis для использования в приложении
 redis_client = RedisClient()
@@ -0,0 +1,147 @@
+import functools
+import hashlib
+import inspect
+import json
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from app.config import settings
+from app.metrics import record_cache
+from app.redis_client import redis_client
+
+# Имя параметра, через который декоратор получает запрос (заголовок If-None-Match)
+REQUEST_PARAM = "_cached_response_request"
+
+
+def response_cache_key(key):
+    """
+    Возвращает ключ Redis, под которым хранится готовый ответ (тело и ETag).
+    :param key: Ключ ответа, например "item:1".
+    """
+    return f"response:{key}"
+
+
+def make_etag(body):
+    """
+    Строгий ETag тела ответа: хэш его байтов (BLAKE2b, 128 бит) в кавычках.
+    """
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def _parse_etags(header):
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def none_match(header, etag):
+    """
+    Проверяет условие If-None-Match: True, если у клиента уже есть это представление.
+    Сравнение слабое (RFC 9110): префикс W/ не учитывается.
+    :param header: Значение заголовка: "*" или ETag через запятую.
+    :param etag: Текущий ETag.
+    """
+    return any(
+        tag == "*" or tag.removeprefix("W/") == etag for tag in _parse_etags(header)
+    )
+
+
+def match(header, etag):
+    """
+    Проверяет условие If-Match: True, если текущее представление совпадает с одним
+    из переданных. Сравнение строгое: слабые ETag (W/"...") не совпадают ни с чем.
+    :param header: Значение заголовка: "*" или ETag через запятую.
+    :param etag: Текущий ETag.
+    """
+    return any(tag == "*" or tag == etag for tag in _parse_etags(header))
+
+
+def cached_response(ttl=None, key=None, model=None, versioned=False, tags=()):
+    """
+    Декоратор маршрута: кэширует итоговое тело JSON-ответа в Redis (и L1) в виде байтов
+    вместе с его ETag, вычисленным один раз при записи в кэш.
+    При попадании байты возвращаются как есть через Response, без разбора JSON
+    и без повторной валидации через response_model.
+    Запрос с If-None-Match, совпадающим с ETag из кэша, получает 304 без тела:
+    из Redis читается только ETag (HGET), тело не читается и не разбирается.
+    Исключения (например, 404) не кэшируются.
+
+    Пример:
+        @router.get("/{item_id}", response_model=ItemSchema)
+        @cached_response(key="item:{item_id}", model=ItemSchema)
+        async def read_item(item_id: int): ...
+
+    :param ttl: Время жизни в секундах (по умолчанию CACHE_EXPIRE).
+    :param key: Шаблон ключа с параметрами маршрута или функция, принимающая их как kwargs.
+    :param model: Pydantic-модель для сериализации результата (обычно совпадает с response_model).
+    :param versioned: Результат — словарь с полем "version", закэшированный под ключом key
+                      через compare-and-set (get_or_load(versioned=True)). Тогда тело
+                      сохраняется, только если эта версия всё ещё текущая: ответ, собранный
+                      до обновления объекта, не попадёт в кэш после его инвалидации.
+    :param tags: Теги тела ответа (шаблоны с параметрами маршрута), например
+                 ("item:{item_id}",): тело удаляется вызовом invalidate_tag
+                 вместе с остальными записями, построенными из того же объекта.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(**kwargs):
+            request = kwargs.pop(REQUEST_PARAM)
+            if_none_match = request.headers.get("if-none-match")
+            name = key(**kwargs) if callable(key) else key.format(**kwargs)
+            cache_key = response_cache_key(name)
+            key_tags = [tag.format(**kwargs) for tag in tags]
+
+            if if_none_match:
+                etag = await redis_client.get_response_etag(cache_key)
+                if etag is not None and none_match(if_none_match, etag):
+                    record_cache(cache_key, "hit")
+                    return Response(status_code=304, headers={"ETag": etag})
+
+            cached = await redis_client.get_response(cache_key)
+            if cached is not None:
+                record_cache(cache_key, "hit")
+                return _response(cached["body"], cached["etag"], if_none_match)
+            record_cache(cache_key, "miss")
+
+            result = await func(**kwargs)
+            if isinstance(result, Response):
+                return result
+
+            # Сериализуем один раз: через Pydantic-модель или как обычный JSON
+            if model is not None:
+                body = model.model_validate(result).model_dump_json().encode()
+            else:
+                body = json.dumps(jsonable_encoder(result)).encode()
+            etag = make_etag(body)
+
+            await redis_client.set_response(
+                cache_key,
+                body,
+                etag,
+                ex=ttl if ttl is not None else settings.CACHE_EXPIRE,
+                version_of=name if versioned else None,
+                version=result["version"] if versioned else None,
+                tags=key_tags,
+            )
+            return _response(body, etag, if_none_match)
+
+        # FastAPI строит параметры маршрута по сигнатуре: добавляем в неё запрос
+        signature = inspect.signature(func)
+        wrapper.__signature__ = signature.replace(
+            parameters=[
+                *signature.parameters.values(),
+                inspect.Parameter(
+                    REQUEST_PARAM, inspect.Parameter.KEYWORD_ONLY, annotation=Request
+                ),
+            ]
+        )
+        return wrapper
+
+    return decorator
+
+
+def _response(body, etag, if_none_match):
+    """
+    Возвращает 304, если у клиента уже есть это представление, иначе тело с ETag.
+    """
+    if if_none_match and none_match(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
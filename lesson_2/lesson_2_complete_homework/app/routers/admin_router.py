@@ -0,0 +1,165 @@
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.config import settings
+from app.redis_client import redis_client
+from app import cache, passwords
+from app.write_behind import write_behind
+from app.warmup import cache_warmer
+from app.search_index import search_index_rebuilder
+from app.change_stream import change_stream
+from app.sessions import get_current_session
+
+router = APIRouter(
+    prefix="/admin",  # Префикс для служебных маршрутов
+    tags=["admin"],  # Теги для документации Swagger
+    # Служебные маршруты сбрасывают кэши и перезапускают поток изменений:
+    # доступны только с действующей сессией
+    dependencies=[Depends(get_current_session)],
+)
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """
+    Возвращает счётчики попаданий/промахов для каждого уровня кэша (L1 и Redis).
+    Используется для подбора размера L1.
+    В entries попадания в отрицательные записи (объекта нет) учтены отдельно.
+    """
+    return {**redis_client.cache_stats(), "entries": cache.stats()}
+
+
+@router.get("/redis/pool")
+async def redis_pool_stats():
+    """
+    Возвращает статистику пула соединений Redis:
+    занятые и свободные соединения, количество ожиданий и время получения соединения.
+    """
+    return redis_client.pool_stats()
+
+
+@router.get("/password-hashing")
+async def password_hashing_stats():
+    """
+    Возвращает загрузку пула хэширования паролей: выполняющиеся операции и длину очереди.
+    """
+    return passwords.stats()
+
+
+@router.get("/write-behind")
+async def write_behind_stats():
+    """
+    Возвращает состояние очереди отложенной записи в базу:
+    отставание (lag), неподтверждённые изменения и возраст самого старого из них.
+    """
+    return await write_behind.stats()
+
+
+@router.post("/cache/rebuild", status_code=202)
+async def rebuild_cache():
+    """
+    Запускает полное перестроение кэша объектов из базы в фоне.
+    В режиме write-behind база может отставать от кэша,
+    поэтому заполняются только отсутствующие ключи.
+    Ход выполнения — в GET /admin/cache/warmup.
+    """
+    if not cache_warmer.start(overwrite=not settings.WRITE_BEHIND_ENABLED):
+        raise HTTPException(status_code=409, detail="Прогрев кэша уже выполняется")
+    return cache_warmer.stats()
+
+
+@router.get("/cache/warmup")
+async def cache_warmup_status():
+    """
+    Возвращает состояние прогрева кэша и итоги последнего запуска.
+    """
+    return cache_warmer.stats()
+
+
+@router.get("/cache/tags/{tag}")
+async def cache_tag_stats(tag: str):
+    """
+    Возвращает количество ключей, помеченных тегом (включая ещё не вычищенные
+    истёкшие), и оставшееся время жизни множества тега.
+    Примеры тегов: "items:pages" — страницы списка, "item:42" — записи объекта 42.
+    """
+    return await redis_client.tag_stats(tag)
+
+
+@router.post("/cache/tags/{tag}/invalidate")
+async def invalidate_cache_tag(
+    tag: str,
+    max_keys: int = Query(
+        settings.CACHE_TAG_MAX_KEYS, ge=1, description="Предел ключей за вызов"
+    ),
+):
+    """
+    Удаляет из кэша все ключи, помеченные тегом, но не больше max_keys за вызов.
+    Если в ответе remaining больше нуля, вызов нужно повторить.
+    """
+    return await redis_client.invalidate_tag(tag, max_keys=max_keys)
+
+
+@router.post("/cache/tags/{tag}/prune")
+async def prune_cache_tag(
+    tag: str,
+    cursor: int = Query(0, ge=0, description="Курсор из предыдущего вызова"),
+    max_keys: int = Query(
+        settings.CACHE_TAG_MAX_KEYS, ge=1, description="Предел проверяемых ключей"
+    ),
+):
+    """
+    Убирает из тега ключи, которых уже нет в Redis (истекли или удалены без тега).
+    Если в ответе cursor не равен нулю, продолжите с ним следующим вызовом.
+    """
+    return await redis_client.prune_tag(tag, cursor=cursor, max_keys=max_keys)
+
+
+@router.post("/search/rebuild", status_code=202)
+async def rebuild_search_index():
+    """
+    Запускает полное перестроение поискового индекса из базы в фоне.
+    Поиск во время перестроения продолжает работать.
+    Ход выполнения — в GET /admin/search/index.
+    """
+    if not search_index_rebuilder.start():
+        raise HTTPException(
+            status_code=409, detail="Перестроение индекса уже выполняется"
+        )
+    return await search_index_rebuilder.stats()
+
+
+@router.get("/search/index")
+async def search_index_status():
+    """
+    Возвращает состояние перестроения поискового индекса и число объектов в нём.
+    """
+    return await search_index_rebuilder.stats()
+
+
+@router.get("/change-stream")
+async def change_stream_stats():
+    """
+    Возвращает длину потока изменений и состояние групп потребителей:
+    позицию, отставание (lag) и неподтверждённые события.
+    """
+    return await change_stream.stats()
+
+
+@router.post("/change-stream/{group}/replay")
+async def replay_change_stream(
+    group: str,
+    from_id: str = Query(
+        "0", description='ID записи, после которой начать повтор ("0" — с начала)'
+    ),
+):
+    """
+    Переводит позицию группы потребителя назад, чтобы события после from_id
+    были обработаны повторно (например, после исправления ошибки в потребителе).
+    """
+    try:
+        await change_stream.replay(group, from_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Потребитель не найден")
+    except redis.ResponseError:
+        raise HTTPException(status_code=400, detail="Неверный ID записи потока")
+    return await change_stream.stats()
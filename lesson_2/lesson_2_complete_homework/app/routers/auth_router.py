@@ -3,6 +3,7 @@ import logging
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+import math
 import uuid
 import time
 
@@ -10,7 +11,19 @@ from app.database import get_db
 from app.models import User
 from app.schemas import UserCreate, UserOut, LoginRequest, LoginResponse
 from app.redis_client import redis_client
-from passlib.context import CryptContext
+from app.login_throttle import (
+    check_login_allowed,
+    register_failed_login,
+    throttle_key,
+)
+from app.passwords import PasswordHashingBusy, hash_password, verify_password
+from app.config import settings
+from app.sessions import (
+    bearer_token,
+    get_current_session,
+    revoke_session,
+    session_key,
+)
 
 # Настраиваем логгер
 logger = logging.getLogger("auth")
@@ -20,15 +33,34 @@ formatter = logging.Formatter("[%(asctime)s] %(levelname)s in %(module)s: %(mess
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-# Создаем контекст для хэширования паролей с использованием bcrypt
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 router = APIRouter(
     prefix="/auth",
     tags=["auth"],
 )
 
 
+def password_hashing_busy():
+    """
+    Ответ при переполненной очереди хэширования: клиенту нужно повторить запрос позже.
+    """
+    return HTTPException(
+        status_code=503,
+        detail="Сервер перегружен. Попробуйте позже.",
+        headers={"Retry-After": "1"},
+    )
+
+
+def throttled(throttle):
+    """
+    Ответ при исчерпанном лимите неудачных попыток входа.
+    """
+    return HTTPException(
+        status_code=403,
+        detail="Слишком много неудачных попыток. Попробуйте позже.",
+        headers={"Retry-After": str(math.ceil(throttle.retry_after))},
+    )
+
+
 @router.post("/register", response_model=UserOut)
 async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """
@@ -47,8 +79,11 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
             status_code=400, detail="Пользователь с таким логином уже зарегистрирован"
         )
 
-    # Хэшируем пароль
-    hashed_password = pwd_context.hash(user.password)
+    # Хэшируем пароль в пуле потоков, не блокируя цикл событий
+    try:
+        hashed_password = await hash_password(user.password)
+    except PasswordHashingBusy:
+        raise password_hashing_busy()
     logger.debug(f"[REGISTER] Хэш для пароля '{user.password}': {hashed_password}")
     new_user = User(
         name=user.name, username=user.username, hashed_password=hashed_password
@@ -64,19 +99,21 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
 async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_db)):
     """
     Endpoint для логина.
-    Если количество неудачных попыток превышает порог, блокирует логин на 5 минут.
+    Если количество неудачных попыток превышает порог (LOGIN_MAX_ATTEMPTS за LOGIN_LOCKOUT_WINDOW),
+    блокирует логин и сообщает в заголовке Retry-After, когда можно повторить.
+    Засчитываются только неудачные попытки: правильный пароль и перегрузка сервера (503)
+    лимит не расходуют. Неверная попытка сверх лимита получает 403, даже если
+    она прошла начальную проверку одновременно с другими.
     При успешной аутентификации сбрасывает счётчик неудачных попыток.
     """
     logger.debug(f"[LOGIN] Попытка входа для пользователя: {login_data.username}")
-    failed_key = f"failed:{login_data.username}"
-    # Сначала проверяем, превышен ли порог неудачных попыток
-    attempts = await redis_client.redis.get(failed_key)
-    logger.debug(f"[LOGIN] Текущее количество неудачных попыток: {attempts}")
-    if attempts and int(attempts) >= 3:
+    failed_key = throttle_key(login_data.username)
+    # Сначала проверяем, не превышен ли порог неудачных попыток
+    throttle = await check_login_allowed(login_data.username)
+    logger.debug(f"[LOGIN] Состояние ограничения попыток: {throttle}")
+    if not throttle.allowed:
         logger.debug(f"[LOGIN] Блокировка входа для пользователя {login_data.username}")
-        raise HTTPException(
-            status_code=403, detail="Слишком много неудачных попыток. Попробуйте позже."
-        )
+        raise throttled(throttle)
 
     # Поиск пользователя в базе
     result = await db.execute(select(User).where(User.username == login_data.username))
@@ -88,34 +125,46 @@ async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_db)):
             f"[LOGIN] Найден пользователь: {user.username}, хэш пароля: {user.hashed_password}"
         )
 
-    # Если пользователя не найден или неверный пароль, увеличиваем счётчик
-    if not user or not pwd_context.verify(login_data.password, user.hashed_password):
+    # Проверяем пароль в пуле потоков, не блокируя цикл событий
+    try:
+        password_ok = user is not None and await verify_password(
+            login_data.password, user.hashed_password
+        )
+    except PasswordHashingBusy:
+        raise password_hashing_busy()
+
+    # Если пользователь не найден или пароль неверный, засчитываем попытку
+    if not password_ok:
         logger.debug(f"[LOGIN] Неверный пароль для пользователя {login_data.username}")
-        # Увеличиваем счётчик неудачных попыток
-        attempts = await redis_client.redis.incr(failed_key)
-        logger.debug(f"[LOGIN] Обновлённое количество неудачных попыток: {attempts}")
-        if attempts == 1:
-            # Устанавливаем TTL на 5 минут
-            await redis_client.redis.expire(failed_key, 300)
-            logger.debug(f"[LOGIN] Установлен TTL 5 минут для ключа {failed_key}")
-        raise HTTPException(status_code=400, detail="Неверный логин или пароль")
-
-    # При успешной аутентификации сбрасываем счётчик неудачных попыток
-    await redis_client.redis.delete(failed_key)
-    logger.debug(f"[LOGIN] Сброшены неудачные попытки для {login_data.username}")
+        # Атомарно засчитываем неудачную попытку (Lua-скрипт, один запрос к Redis)
+        throttle = await register_failed_login(login_data.username)
+        logger.debug(f"[LOGIN] Состояние после неудачной попытки: {throttle}")
+        if not throttle.allowed:
+            # Лимит исчерпали одновременные неверные попытки
+            raise throttled(throttle)
+        raise HTTPException(
+            status_code=400,
+            detail="Неверный логин или пароль",
+            headers={"X-Login-Attempts-Remaining": str(throttle.remaining)},
+        )
 
     # Генерируем уникальный токен сессии
     token = str(uuid.uuid4())
-    session_key = f"session:{token}"
+    key = session_key(token)
     session_data = {
         "user_id": user.id,
         "username": user.username,
         "created_at": str(time.time()),
     }
-    # Сохраняем данные сессии в Redis с TTL 30 минут
-    await redis_client.redis.hset(session_key, mapping=session_data)
-    await redis_client.redis.expire(session_key, 1800)
-    logger.debug(f"[LOGIN] Сессия создана: {session_key} с данными {session_data}")
+    # Одной транзакцией сбрасываем счётчик неудачных попыток
+    # и сохраняем данные сессии в Redis с TTL SESSION_TTL
+    async with redis_client.transaction() as pipe:
+        pipe.delete(failed_key)
+        pipe.hset(key, mapping=session_data)
+        pipe.expire(key, settings.SESSION_TTL)
+        await pipe.execute()
+    logger.debug(f"[LOGIN] Сброшены неудачные попытки для {login_data.username}")
+    logger.debug(f"[LOGIN] Сессия создана: {key} с данными {session_data}")
     return {"token": token}
 
 
@@ -124,18 +173,21 @@ async def logout(request: Request):
     """
     Endpoint для выхода из системы.
     Ожидается, что сессионный токен передается в заголовке Authorization в формате 'Bearer <token>'.
-    Удаляет сессионный токен из Redis.
+    Удаляет сессию из Redis и отзывает её из локальных кэшей всех процессов.
     """
     auth_header = request.headers.get("Authorization")
     logger.debug(f"[LOGOUT] Заголовок авторизации: {auth_header}")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        logger.debug("[LOGOUT] Отсутствует или неверный заголовок авторизации")
-        raise HTTPException(
-            status_code=401, detail="Отсутствует или неверный заголовок авторизации"
-        )
-    token = auth_header.split(" ")[1]
-    session_key = f"session:{token}"
-    await redis_client.redis.delete(session_key)
-    logger.debug(f"[LOGOUT] Сессия {session_key} удалена")
+    token = bearer_token(request)
+    await revoke_session(token)
+    logger.debug(f"[LOGOUT] Сессия {session_key(token)} удалена")
     return {"detail": "Вы успешно вышли из системы"}
+
+
+@router.get("/me")
+async def me(session: dict = Depends(get_current_session)):
+    """
+    Endpoint, возвращающий данные текущей сессии.
+    Пример защищённого маршрута с зависимостью get_current_session.
+    """
+    return {"user_id": session["user_id"], "username": session["username"]}
 # END
@@ -0,0 +1,30 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.warmup import cache_warmer
+
+router = APIRouter(
+    prefix="/health",  # Префикс для проверок состояния
+    tags=["health"],  # Теги для документации Swagger
+)
+
+
+@router.get("/live")
+async def live():
+    """
+    Проверка живости: процесс запущен и отвечает на запросы.
+    """
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def ready():
+    """
+    Проверка готовности: 200 только после завершения первого прогрева кэша,
+    до этого 503, чтобы балансировщик не направлял трафик на холодный экземпляр.
+    """
+    if not cache_warmer.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "warming_up", "warmup": cache_warmer.stats()},
+        )
+    return {"status": "ready"}
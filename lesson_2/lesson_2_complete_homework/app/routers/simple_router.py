@@ -1,60 +1,327 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Literal, Optional
+import json
+import logging
+import time
+from pydantic import ValidationError
+from sqlalchemy import bindparam, delete, insert, update
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-import json
-from app.database import get_db
+from app.config import settings
+from app.database import get_db, AsyncSessionLocal
 from app.models import Item
-from app.schemas import Item as ItemSchema, ItemCreate
+from app.schemas import (
+    Item as ItemSchema,
+    ItemBulkResult,
+    ItemCreate,
+    ItemPage,
+    ItemSearchHit,
+)
 from app.redis_client import redis_client
+from app.cache import (
+    ITEMS_LIST_VERSION_KEY,
+    ITEMS_PAGES_TAG,
+    get_or_load,
+    invalidate_item_pages,
+    set_value,
+    set_tombstone,
+    set_tombstones,
+    get_many,
+    set_many,
+)
+from app.response_cache import cached_response, make_etag, match
+from app.search_index import search_items
+from app.change_stream import publish_change, publish_changes
+from app.write_behind import (
+    enqueue_delete,
+    enqueue_upsert,
+    enqueue_upserts,
+    next_item_id,
+    next_item_ids,
+)
+
+logger = logging.getLogger("items")
 
 router = APIRouter(
     prefix="/items",  # Префикс для всех маршрутов в этом роутере
     tags=["items"],  # Теги для документации Swagger
 )
 
+# Запрос объекта по ID строится один раз: в запросах меняется только параметр,
+# а скомпилированный SQL берётся из кэша движка
+ITEM_BY_ID = select(Item).where(Item.id == bindparam("item_id"))
+
+# Вставка порции объектов одним INSERT ... VALUES (...), (...) RETURNING.
+# sort_by_parameter_order не используется: на SQLite он разбивает вставку
+# на отдельные INSERT по строке
+INSERT_ITEMS = insert(Item).returning(
+    Item.id, Item.name, Item.description, Item.version
+)
+
+# Обновление одним UPDATE ... RETURNING: версия увеличивается в той же строке,
+# поэтому возвращённые данные и их версия всегда соответствуют друг другу,
+# а одновременные обновления получают разные версии в порядке фиксации
+UPDATE_ITEM = (
+    update(Item)
+    .where(Item.id == bindparam("item_id"))
+    .values(
+        name=bindparam("new_name"),
+        description=bindparam("new_description"),
+        version=Item.version + 1,
+    )
+    .returning(Item.id, Item.name, Item.description, Item.version)
+    .execution_options(synchronize_session=False)
+)
+
+# Условное обновление (If-Match): строка меняется, только если её версия
+# всё ещё та, что была проверена, иначе UPDATE не затрагивает ни одной строки
+UPDATE_ITEM_IF_VERSION = UPDATE_ITEM.where(
+    Item.version == bindparam("expected_version")
+)
+
+# Удаление с возвратом последней версии строки: запись об удалении в кэше
+# получает версию больше неё и не будет затёрта данными, прочитанными до удаления
+DELETE_ITEM = (
+    delete(Item)
+    .where(Item.id == bindparam("item_id"))
+    .returning(Item.version)
+    .execution_options(synchronize_session=False)
+)
+
+# Типы содержимого, при которых тело массового создания читается как NDJSON
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl")
+
+
+@router.get("/batch", response_model=list[ItemSchema])
+async def read_items_batch(
+    ids: list[int] = Query(..., max_length=settings.BATCH_MAX_IDS),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Получает несколько объектов по списку ID: `/items/batch?ids=1&ids=2`.
+    Кэш проверяется одним MGET, промахи загружаются одним запросом `IN`
+    и записываются в кэш одним конвейером SET.
+    Отсутствующие в базе ID пропускаются и кэшируются как отрицательные записи.
+    """
+    ids = list(dict.fromkeys(ids))  # Убираем повторы, сохраняя порядок
+    keys = {item_id: f"item:{item_id}" for item_id in ids}
+
+    cached = await get_many(list(keys.values()), versioned=True)
+    items = {item_id: cached[key] for item_id, key in keys.items() if key in cached}
+
+    missing = [item_id for item_id in ids if item_id not in items]
+    if missing:
+        started = time.monotonic()
+        result = await db.execute(
+            select(Item.id, Item.name, Item.description, Item.version).where(
+                Item.id.in_(missing)
+            )
+        )
+        loaded = {row["id"]: dict(row) for row in result.mappings()}
+        delta = time.monotonic() - started
+
+        if loaded:
+            await set_many(
+                {keys[item_id]: item for item_id, item in loaded.items()},
+                ex=settings.ITEM_CACHE_EXPIRE,
+                delta=delta,
+                versioned=True,
+            )
+        absent = [keys[item_id] for item_id in missing if item_id not in loaded]
+        if absent:
+            await set_tombstones(absent, version=0)
+        items.update(loaded)
+
+    # Данные уже в форме ItemSchema, повторная валидация не нужна.
+    # Пустые значения — отрицательные записи кэша (объекта нет)
+    return JSONResponse([items[item_id] for item_id in ids if items.get(item_id)])
+
+
+@router.get("/search", response_model=list[ItemSearchHit])
+async def search(
+    q: str = Query(..., min_length=1, max_length=200, description="Строка поиска"),
+    mode: Literal["prefix", "words"] = Query(
+        "prefix",
+        description="prefix — имя начинается с q (автодополнение), "
+        "words — имя содержит все слова q",
+    ),
+    limit: int = Query(
+        settings.SEARCH_DEFAULT_LIMIT, ge=1, le=settings.SEARCH_MAX_LIMIT
+    ),
+):
+    """
+    Поиск объектов по имени без учёта регистра и знаков препинания.
+    Отвечает только индекс в Redis (ZRANGEBYLEX по нормализованным именам
+    и множества ID по словам), база не используется.
+    """
+    return JSONResponse(await search_items(q, mode, limit))
+
+
+@router.get("/export")
+async def export_items(
+    after: Optional[int] = Query(
+        None, description="Продолжить выгрузку после объекта с этим ID"
+    ),
+    format: Literal["ndjson", "json"] = Query(
+        "ndjson", description="ndjson — объект в строке, json — один массив"
+    ),
+):
+    """
+    Выгружает все объекты по возрастанию ID потоком, не собирая ответ в памяти.
+    Строки читаются из курсора порциями по ITEMS_EXPORT_CHUNK_SIZE (yield_per),
+    и каждая порция сразу отправляется клиенту, поэтому память не растёт
+    с размером таблицы. Если выгрузка прервалась, её можно продолжить,
+    передав в `after` ID последнего полученного объекта.
+    """
+    if format == "ndjson":
+        return StreamingResponse(
+            export_ndjson(after), media_type="application/x-ndjson"
+        )
+    return StreamingResponse(export_json_array(after), media_type="application/json")
+
+
+async def export_chunks(after):
+    """
+    Читает объекты из курсора порциями по ITEMS_EXPORT_CHUNK_SIZE.
+    Зависимость get_db закрывает сессию до отправки тела ответа,
+    поэтому генератор открывает собственную сессию.
+    :param after: ID, после которого начинается выгрузка (None — с начала).
+    :return: Асинхронный генератор списков объектов, закодированных в JSON (байты).
+    """
+    query = (
+        select(Item.id, Item.name, Item.description, Item.version)
+        .order_by(Item.id)
+        .execution_options(yield_per=settings.ITEMS_EXPORT_CHUNK_SIZE)
+    )
+    if after is not None:
+        query = query.where(Item.id > after)
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query)
+        try:
+            async for rows in result.mappings().partitions():
+                yield [
+                    json.dumps(dict(row), ensure_ascii=False).encode() for row in rows
+                ]
+        finally:
+            await result.close()
+
+
+async def export_ndjson(after):
+    """
+    Тело выгрузки в NDJSON: одна порция объектов — один фрагмент ответа.
+    """
+    async for rows in export_chunks(after):
+        yield b"".join(row + b"\n" for row in rows)
+
+
+async def export_json_array(after):
+    """
+    Тело выгрузки в виде одного JSON-массива, отправляемого по частям.
+    """
+    yield b"["
+    separator = b""
+    async for rows in export_chunks(after):
+        yield separator + b",".join(rows)
+        separator = b","
+    yield b"]"
+
+
+async def load_item(item_id):
+    """
+    Загружает объект из базы в виде словаря ItemSchema.
+    Загрузка может выполняться в фоне после ответа,
+    поэтому используется собственная сессия, а не сессия запроса.
+    :return: Словарь или None, если объекта нет.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(ITEM_BY_ID, {"item_id": item_id})
+        item = result.scalar_one_or_none()
+        if not item:
+            return None
+        # Преобразуем объект базы данных в Pydantic-схему
+        return ItemSchema.model_validate(item).model_dump()
+
 
 @router.get("/{item_id}", response_model=ItemSchema)
-async def read_item(item_id: int, db: AsyncSession = Depends(get_db)):
+@cached_response(
+    key="item:{item_id}",
+    model=ItemSchema,
+    ttl=settings.ITEM_CACHE_EXPIRE,
+    versioned=True,
+    tags=("item:{item_id}",),
+)
+async def read_item(item_id: int):
     """
     Получает объект из базы данных по его ID.
+    Готовое тело ответа кэшируется целиком и при попадании отдаётся без разбора JSON.
     Если объект есть в Redis, возвращает данные из кэша.
     В противном случае извлекает из базы, кэширует и возвращает результат.
+    Отсутствие объекта тоже кэшируется на CACHE_NEGATIVE_TTL секунд,
+    чтобы запросы несуществующих ID не доходили до базы.
+    Незадолго до истечения или сразу после него запись обновляется в фоне,
+    а клиент получает текущее значение без ожидания базы.
+    Записи кэша версионируются: значение, прочитанное из базы до обновления объекта,
+    не затрёт в кэше обновлённое, даже если будет записано позже.
+    Ответ содержит ETag; запрос с совпадающим If-None-Match получает 304 без тела.
     """
     cache_key = f"item:{item_id}"
 
-    # Проверяем, есть ли объект в кэше Redis
-    cached_item = await redis_client.get(cache_key)
-    if cached_item:
-        return json.loads(cached_item)
+    # Берём объект из кэша (L1 процесса, затем Redis), а при промахе загружаем его
+    # из базы один раз на все одновременные запросы и кэшируем на ITEM_CACHE_EXPIRE секунд
+    item_data = await get_or_load(
+        cache_key,
+        lambda: load_item(item_id),
+        ex=settings.ITEM_CACHE_EXPIRE,
+        versioned=True,
+    )
 
-    # Если объекта нет в кэше, выполняем запрос к базе данных
-    result = await db.execute(select(Item).where(Item.id == item_id))
-    item = result.scalar_one_or_none()
-
-    if not item:
+    if not item_data:
         raise HTTPException(status_code=404, detail="Item not found")
 
-    # Преобразуем объект базы данных в Pydantic-схему
-    item_data = ItemSchema.model_validate(item).model_dump()
-
-    # Кэшируем результат в Redis на 60 секунд
-    await redis_client.set(cache_key, json.dumps(item_data), ex=60)
-
     return item_data
 
 
-@router.get("/", response_model=list[ItemSchema])
-async def get_all_items(db: AsyncSession = Depends(get_db)):
+@router.get("/", response_model=ItemPage)
+async def get_all_items(
+    after: Optional[int] = Query(
+        None, description="ID последнего объекта предыдущей страницы"
+    ),
+    limit: int = Query(settings.PAGE_DEFAULT_LIMIT, ge=1, le=settings.PAGE_MAX_LIMIT),
+):
     """
-    Получает все объекты из базы данных.
-    Кэширование результата в Redis не требуется.
+    Получает страницу объектов, упорядоченных по ID (keyset-пагинация).
+    Для следующей страницы передайте `next_cursor` из ответа в параметре `after`.
+    Страницы кэшируются в Redis под текущей версией списка,
+    которую create/update/delete увеличивают, поэтому устаревшие страницы не отдаются.
+    Все страницы помечены тегом ITEMS_PAGES_TAG, и изменения удаляют прежние страницы
+    из Redis, не дожидаясь их TTL.
     """
-    result = await db.execute(select(Item))
-    items = result.scalars().all()  # Получаем список всех объектов
+    version = await redis_client.get(ITEMS_LIST_VERSION_KEY) or 0
+    cache_key = f"items:page:v{version}:{after or 0}:{limit}"
+
+    async def load_page():
+        async with AsyncSessionLocal() as db:
+            # Выбираем только нужные столбцы, без построения ORM-объектов
+            query = select(Item.id, Item.name, Item.description, Item.version).order_by(
+                Item.id
+            )
+            if after is not None:
+                query = query.where(Item.id > after)
+            result = await db.execute(query.limit(limit))
+            items = [dict(row) for row in result.mappings()]
+
+        next_cursor = items[-1]["id"] if len(items) == limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    page = await get_or_load(
+        cache_key, load_page, ex=settings.CACHE_EXPIRE, tags=(ITEMS_PAGES_TAG,)
+    )
 
-    return [
-        ItemSchema.model_validate(item).model_dump() for item in items
-    ]  # Преобразуем в Pydantic-схему
+    # Данные уже в форме ItemPage, повторная валидация через response_model не нужна
+    return JSONResponse(page)
 
 
 @router.post("/create/", response_model=ItemSchema)
@@ -62,7 +329,22 @@ async def create_item(item: ItemCreate, db: AsyncSession = Depends(get_db)):
     """
     Создание нового предмета.
     Принимает данные из схемы `ItemCreate`, добавляет их в базу данных и возвращает созданный объект.
+    В режиме write-behind объект сразу попадает в кэш, а в базу записывается в фоне.
     """
+    if settings.WRITE_BEHIND_ENABLED:
+        new_item = {"id": await next_item_id(), **item.model_dump(), "version": 1}
+        await enqueue_upsert(new_item)
+        await set_value(
+            f"item:{new_item['id']}",
+            new_item,
+            ex=settings.ITEM_CACHE_EXPIRE,
+            version=1,
+            mode="force",
+        )
+        await publish_change("upsert", new_item["id"], new_item)
+        await invalidate_item_pages()
+        return new_item
+
     new_item = Item(
         name=item.name, description=item.description
     )  # Создаем объект модели
@@ -70,36 +352,143 @@ async def create_item(item: ItemCreate, db: AsyncSession = Depends(get_db)):
     await db.commit()  # Фиксируем изменения в базе данных
     await db.refresh(new_item)  # Обновляем объект из базы данных (получаем `id`)
 
+    # Сразу кладём объект в кэш: это же снимает отрицательную запись,
+    # если этот ID уже запрашивали до создания
+    created_item = ItemSchema.model_validate(new_item).model_dump()
+    await set_value(
+        f"item:{new_item.id}",
+        created_item,
+        ex=settings.ITEM_CACHE_EXPIRE,
+        version=created_item["version"],
+        mode="force",
+    )
+    # Поисковый индекс и другие потребители обновятся по событию из потока изменений
+    await publish_change("upsert", new_item.id, created_item)
+    # Закэшированные страницы списка больше не актуальны
+    await invalidate_item_pages()
+
     return new_item  # Возвращаем созданный объект
 
 
+@router.post("/bulk", response_model=ItemBulkResult)
+async def create_items_bulk(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Массовое создание объектов. Тело — JSON-массив объектов `ItemCreate`
+    или NDJSON (`Content-Type: application/x-ndjson`, по объекту в строке).
+    Строки сохраняются порциями по ITEMS_BULK_CHUNK_SIZE: на порцию приходится
+    одна транзакция с одним INSERT ... RETURNING и один конвейер записи в кэш.
+    Ошибочные строки не прерывают загрузку, а возвращаются в `errors` с номером строки
+    (с нуля, пустые строки NDJSON не считаются); если не удалось сохранить порцию,
+    ошибкой помечаются все её строки.
+    :return: ID созданных объектов в порядке строк и ошибки строк.
+    """
+    created = []
+    errors = []
+    chunk = []  # Пары (номер строки, ItemCreate) текущей порции
+
+    async def flush():
+        try:
+            items = await insert_items_chunk(db, [row for _, row in chunk])
+        except SQLAlchemyError:
+            logger.exception("Не удалось сохранить порцию из %d объектов", len(chunk))
+            errors.extend(
+                {"index": index, "error": "Не удалось сохранить объект в базе данных"}
+                for index, _ in chunk
+            )
+            return
+        created.extend(item["id"] for item in items)
+
+    async for index, row in read_bulk_rows(request):
+        if index >= settings.ITEMS_BULK_MAX_ROWS:
+            errors.append(
+                {
+                    "index": index,
+                    "error": f"Превышено максимальное количество строк "
+                    f"({settings.ITEMS_BULK_MAX_ROWS}), остальные строки не обработаны",
+                }
+            )
+            break
+        if isinstance(row, str):
+            errors.append({"index": index, "error": row})
+            continue
+        chunk.append((index, row))
+        if len(chunk) >= settings.ITEMS_BULK_CHUNK_SIZE:
+            await flush()
+            chunk = []
+    if chunk:
+        await flush()
+
+    if created:
+        # Закэшированные страницы списка больше не актуальны
+        await invalidate_item_pages()
+    return JSONResponse({"created": created, "errors": errors})
+
+
 @router.put("/{item_id}", response_model=ItemSchema)
 async def update_item(
-    item_id: int, item: ItemCreate, db: AsyncSession = Depends(get_db)
+    item_id: int,
+    item: ItemCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Обновляет объект в базе данных и в кэше Redis.
+    Версия объекта увеличивается, и кэш принимает запись, только если
+    в нём нет более новой версии.
+    С заголовком If-Match объект обновляется, только если его текущий ETag
+    (тот же, что отдаёт GET /items/{item_id}) совпадает с переданным, иначе 412.
+    Новый ETag возвращается в заголовке ответа.
+    В режиме write-behind кэш обновляется сразу, а база — в фоне.
     """
-    # Проверяем существование объекта в базе данных
-    result = await db.execute(select(Item).where(Item.id == item_id))
-    db_item = result.scalar_one_or_none()
+    if settings.WRITE_BEHIND_ENABLED:
+        updated_item = await update_item_write_behind(item_id, item, if_match)
+        response.headers["ETag"] = item_etag(updated_item)
+        return updated_item
 
-    if not db_item:
-        raise HTTPException(status_code=404, detail="Item not found")
+    statement = UPDATE_ITEM
+    params = {
+        "item_id": item_id,
+        "new_name": item.name,
+        "new_description": item.description,
+    }
+    if if_match is not None:
+        result = await db.execute(ITEM_BY_ID, {"item_id": item_id})
+        current = result.scalar_one_or_none()
+        if current is None:
+            raise HTTPException(status_code=404, detail="Item not found")
+        if not match(if_match, item_etag(current)):
+            raise HTTPException(status_code=412, detail="Precondition failed")
+        # Проверенная версия должна остаться текущей до самого обновления
+        statement = UPDATE_ITEM_IF_VERSION
+        params["expected_version"] = current.version
 
-    # Обновляем объект в базе данных
-    db_item.name = item.name
-    db_item.description = item.description
-    await db.commit()  # Сохраняем изменения
-    await db.refresh(db_item)  # Обновляем объект
+    # Обновляем объект и получаем его новую версию одним запросом
+    result = await db.execute(statement, params)
+    validated_item = result.mappings().one_or_none()
 
-    # Преобразуем объект в Pydantic-схему
-    validated_item = ItemSchema.model_validate(db_item).model_dump()
+    if validated_item is None:
+        if if_match is not None:
+            # Объект изменили или удалили после проверки If-Match
+            raise HTTPException(status_code=412, detail="Precondition failed")
+        raise HTTPException(status_code=404, detail="Item not found")
+    await db.commit()  # Сохраняем изменения
+    validated_item = dict(validated_item)
 
-    # Обновляем кэш в Redis
+    # Обновляем кэш в Redis и сбрасываем L1 во всех процессах
     cache_key = f"item:{item_id}"
-    await redis_client.set(cache_key, json.dumps(validated_item), ex=60)
+    await set_value(
+        cache_key,
+        validated_item,
+        ex=settings.ITEM_CACHE_EXPIRE,
+        version=validated_item["version"],
+    )
+    # Записи, построенные из объекта (готовый ответ), помечены тегом его ключа
+    await redis_client.invalidate_tag(cache_key)
+    await publish_change("upsert", item_id, validated_item)
+    await invalidate_item_pages()
 
+    response.headers["ETag"] = item_etag(validated_item)
     return validated_item
 
 
@@ -107,20 +496,194 @@ async def update_item(
 async def delete_item(item_id: int, db: AsyncSession = Depends(get_db)):
     """
     Удаление объекта из базы данных и кэша Redis.
+    В режиме write-behind объект сразу удаляется из кэша, а из базы — в фоне.
     """
-    # Проверяем существование объекта
-    result = await db.execute(select(Item).where(Item.id == item_id))
-    db_item = result.scalar_one_or_none()
+    if settings.WRITE_BEHIND_ENABLED:
+        await delete_item_write_behind(item_id)
+        return {"detail": "Item deleted"}
 
-    if not db_item:
-        raise HTTPException(status_code=404, detail="Item not found")
+    # Удаляем объект из базы данных, получая его последнюю версию
+    result = await db.execute(DELETE_ITEM, {"item_id": item_id})
+    version = result.scalar_one_or_none()
 
-    # Удаляем объект из базы данных
-    await db.delete(db_item)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Item not found")
     await db.commit()
 
-    # Удаляем объект из кэша
+    # Заменяем объект в кэше записью об удалении (следующей версии), чтобы чтение,
+    # начатое до удаления, не вернуло объект в кэш; сбрасываем готовый ответ и L1
     cache_key = f"item:{item_id}"
-    await redis_client.delete(cache_key)
+    await set_tombstone(cache_key, version=version + 1)
+    await redis_client.invalidate_tag(cache_key)
+    await publish_change("delete", item_id, version=version + 1)
+    await invalidate_item_pages()
 
     return {"detail": "Item deleted"}
+
+
+def item_etag(item):
+    """
+    ETag объекта: совпадает с ETag тела ответа GET /items/{item_id}.
+    :param item: Объект модели или словарь ItemSchema.
+    """
+    return make_etag(ItemSchema.model_validate(item).model_dump_json().encode())
+
+
+async def require_item(item_id):
+    """
+    Возвращает объект из кэша или базы (в режиме write-behind новые объекты
+    могут быть ещё только в кэше).
+    :raises HTTPException: 404, если объекта нет.
+    """
+    item_data = await get_or_load(
+        f"item:{item_id}",
+        lambda: load_item(item_id),
+        ex=settings.ITEM_CACHE_EXPIRE,
+        versioned=True,
+    )
+    if not item_data:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return item_data
+
+
+async def update_item_write_behind(item_id, item, if_match=None):
+    """
+    Обновление в режиме write-behind: изменение ставится в очередь, кэш обновляется сразу.
+    Версию выдаёт кэш (следующая после текущей), а в базу она попадает вместе с изменением,
+    поэтому загрузка из ещё не догнавшей базы не затрёт изменение в кэше.
+    If-Match сверяется с объектом из кэша; проверка и запись не атомарны,
+    поэтому одновременное обновление между ними может пройти незамеченным.
+    """
+    current = await require_item(item_id)
+    if if_match is not None and not match(if_match, item_etag(current)):
+        raise HTTPException(status_code=412, detail="Precondition failed")
+    updated_item = {
+        "id": item_id,
+        **item.model_dump(),
+        "version": current["version"] + 1,
+    }
+    await enqueue_upsert(updated_item)
+
+    cache_key = f"item:{item_id}"
+    await set_value(
+        cache_key,
+        updated_item,
+        ex=settings.ITEM_CACHE_EXPIRE,
+        version=updated_item["version"],
+    )
+    await redis_client.invalidate_tag(cache_key)
+    await publish_change("upsert", item_id, updated_item)
+    await invalidate_item_pages()
+    return updated_item
+
+
+async def delete_item_write_behind(item_id):
+    """
+    Удаление в режиме write-behind: удаление ставится в очередь, кэш очищается сразу.
+    """
+    current = await require_item(item_id)
+    await enqueue_delete(item_id)
+
+    # Пока удаление не дошло до базы, храним в кэше отрицательную запись:
+    # иначе промах кэша снова загрузил бы объект из базы
+    cache_key = f"item:{item_id}"
+    await set_tombstone(
+        cache_key, ex=settings.CACHE_EXPIRE, version=current["version"] + 1
+    )
+    await redis_client.invalidate_tag(cache_key)
+    await publish_change("delete", item_id, version=current["version"] + 1)
+    await invalidate_item_pages()
+
+
+def _parse_row(validate, data):
+    """
+    Проверяет одну строку массового создания.
+    :return: ItemCreate или текст ошибки.
+    """
+    try:
+        return validate(data)
+    except ValidationError as error:
+        return "; ".join(
+            f"{'.'.join(str(part) for part in detail['loc']) or 'row'}: {detail['msg']}"
+            for detail in error.errors()
+        )
+
+
+async def read_bulk_rows(request):
+    """
+    Читает строки массового создания из тела запроса.
+    NDJSON разбирается по мере поступления тела, без чтения всего запроса в память.
+    :return: Асинхронный генератор пар (номер строки, ItemCreate или текст ошибки).
+    :raises HTTPException: 400 — тело не JSON-массив; 413 — в массиве больше
+                           ITEMS_BULK_MAX_ROWS строк.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type in NDJSON_CONTENT_TYPES:
+        index = 0
+        buffer = b""
+        async for data in request.stream():
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield index, _parse_row(ItemCreate.model_validate_json, line)
+                    index += 1
+        if buffer.strip():
+            yield index, _parse_row(ItemCreate.model_validate_json, buffer)
+        return
+
+    try:
+        rows = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Тело запроса не является JSON")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Ожидается JSON-массив объектов")
+    if len(rows) > settings.ITEMS_BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Не больше {settings.ITEMS_BULK_MAX_ROWS} объектов за запрос",
+        )
+    for index, row in enumerate(rows):
+        yield index, _parse_row(ItemCreate.model_validate, row)
+
+
+async def insert_items_chunk(db, rows):
+    """
+    Сохраняет порцию объектов одним INSERT ... RETURNING в отдельной транзакции
+    и записывает их в кэш одним конвейером (заодно снимая отрицательные записи).
+    В режиме write-behind ID выделяются одним INCRBY, а запись в базу
+    ставится в очередь одним конвейером XADD.
+    :param rows: Список ItemCreate.
+    :return: Список созданных объектов в виде словарей ItemSchema.
+    :raises SQLAlchemyError: если порцию не удалось вставить (транзакция откатывается).
+    """
+    if settings.WRITE_BEHIND_ENABLED:
+        ids = await next_item_ids(len(rows))
+        items = [
+            {"id": item_id, **row.model_dump(), "version": 1}
+            for item_id, row in zip(ids, rows)
+        ]
+        await enqueue_upserts(items)
+    else:
+        try:
+            result = await db.execute(INSERT_ITEMS, [row.model_dump() for row in rows])
+            # Строки RETURNING могут прийти в любом порядке, но ID внутри одного
+            # INSERT выдаются по порядку VALUES, поэтому сортировка по ID
+            # восстанавливает порядок входных строк
+            items = sorted(
+                (dict(item) for item in result.mappings()), key=lambda item: item["id"]
+            )
+            await db.commit()
+        except SQLAlchemyError:
+            await db.rollback()
+            raise
+
+    await set_many(
+        {f"item:{item['id']}": item for item in items},
+        ex=settings.ITEM_CACHE_EXPIRE,
+        broadcast=True,
+        versioned=True,
+        mode="force",
+    )
+    await publish_changes("upsert", items)
+    return items
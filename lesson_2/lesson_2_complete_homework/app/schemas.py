@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import Optional
 
 
 class ItemBase(BaseModel):
@@ -15,11 +16,36 @@ class ItemCreate(ItemBase):
 
 class Item(ItemBase):
     id: int
+    version: int  # Растёт при каждом изменении объекта
 
     class Config:
         from_attributes = True
 
 
+# Страница списка объектов с курсором для запроса следующей страницы
+class ItemPage(BaseModel):
+    items: list[Item]
+    next_cursor: Optional[int] = None
+
+
+# Ошибка одной строки массового создания объектов
+class ItemBulkError(BaseModel):
+    index: int  # Номер строки во входных данных (с нуля)
+    error: str
+
+
+# Результат массового создания: ID созданных объектов в порядке строк и ошибки строк
+class ItemBulkResult(BaseModel):
+    created: list[int]
+    errors: list[ItemBulkError]
+
+
+# Результат поиска объектов по имени
+class ItemSearchHit(BaseModel):
+    id: int
+    name: str
+
+
 # BEGIN YOUR SOLUTION HERE
 # Схема для создания/регистрации пользователя
 class UserCreate(BaseModel):
@@ -0,0 +1,339 @@
+import asyncio
+import logging
+import re
+import time
+import unicodedata
+from sqlalchemy.future import select
+from app.change_stream import ChangeConsumer
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import Item
+from app.redis_client import redis_client
+
+logger = logging.getLogger("search_index")
+
+# Отсортированное множество "<нормализованное имя>\0<id>" с нулевым весом:
+# члены упорядочены лексикографически, поиск по префиксу — ZRANGEBYLEX
+NAMES_KEY = "items:search:names"
+# Хэш id -> нормализованное имя: по нему старые записи удаляются без обращения к базе
+NORMALIZED_KEY = "items:search:normalized"
+# Хэш id -> исходное имя для выдачи результатов
+DISPLAY_KEY = "items:search:display"
+# Префикс множеств ID объектов, в имени которых есть слово
+TOKEN_KEY_PREFIX = "items:search:token:"
+# Хэш id -> версия объекта в индексе (для удалённых — версия удаления): изменения,
+# пришедшие не в порядке версий, не откатывают индекс к устаревшему имени
+VERSIONS_KEY = "items:search:version"
+
+# Удаляет прежние записи объекта из индекса (если были) и добавляет новые,
+# если версия не старше уже проиндексированной (равная применяется повторно).
+# ARGV: префикс ключей слов, затем четвёрки (id, версия, нормализованное имя, исходное имя).
+# Ключи слов вычисляются внутри скрипта, поэтому индекс рассчитан на один узел Redis.
+# Возвращает количество применённых объектов
+INDEX_SCRIPT = """
+local prefix = ARGV[1]
+local applied = 0
+for i = 2, #ARGV, 4 do
+    local id, version = ARGV[i], tonumber(ARGV[i + 1])
+    local normalized, display = ARGV[i + 2], ARGV[i + 3]
+    local current = tonumber(redis.call("HGET", KEYS[4], id))
+    if not current or current <= version then
+        local old = redis.call("HGET", KEYS[2], id)
+        if old then
+            redis.call("ZREM", KEYS[1], old .. "\\0" .. id)
+            for token in string.gmatch(old, "%S+") do
+                redis.call("SREM", prefix .. token, id)
+            end
+        end
+        redis.call("ZADD", KEYS[1], 0, normalized .. "\\0" .. id)
+        for token in string.gmatch(normalized, "%S+") do
+            redis.call("SADD", prefix .. token, id)
+        end
+        redis.call("HSET", KEYS[2], id, normalized)
+        redis.call("HSET", KEYS[3], id, display)
+        redis.call("HSET", KEYS[4], id, version)
+        applied = applied + 1
+    end
+end
+return applied
+"""
+
+# Удаляет объекты из индекса, если версия удаления не старше проиндексированной,
+# и запоминает её, чтобы запоздавшее изменение не вернуло объект в индекс.
+# ARGV: префикс ключей слов, затем пары (id, версия). Пустая версия — удаление
+# без проверки, вместе с запомненной версией (объекта нет в базе).
+# Возвращает количество удалённых из индекса объектов
+UNINDEX_SCRIPT = """
+local prefix = ARGV[1]
+local removed = 0
+for i = 2, #ARGV, 2 do
+    local id, version = ARGV[i], tonumber(ARGV[i + 1])
+    local current = tonumber(redis.call("HGET", KEYS[4], id))
+    if not version or not current or current <= version then
+        local old = redis.call("HGET", KEYS[2], id)
+        if old then
+            redis.call("ZREM", KEYS[1], old .. "\\0" .. id)
+            for token in string.gmatch(old, "%S+") do
+                redis.call("SREM", prefix .. token, id)
+            end
+            redis.call("HDEL", KEYS[2], id)
+            redis.call("HDEL", KEYS[3], id)
+            removed = removed + 1
+        end
+        if version then
+            redis.call("HSET", KEYS[4], id, version)
+        else
+            redis.call("HDEL", KEYS[4], id)
+        end
+    end
+end
+return removed
+"""
+
+INDEX_KEYS = [NAMES_KEY, NORMALIZED_KEY, DISPLAY_KEY, VERSIONS_KEY]
+
+
+def normalize(text):
+    """
+    Приводит строку к виду, в котором она хранится в индексе:
+    Unicode NFKC, без учёта регистра, слова через один пробел без знаков препинания.
+    Пример: "  Красный-Шар!" -> "красный шар".
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(re.findall(r"\w+", text))
+
+
+async def index_items(items):
+    """
+    Добавляет объекты в индекс или обновляет их записи, одним вызовом скрипта.
+    Объект, в индексе которого уже более новая версия, пропускается.
+    :param items: Список словарей с ключами "id", "name" и "version".
+    :return: Количество применённых объектов.
+    """
+    if not items:
+        return 0
+    args = [TOKEN_KEY_PREFIX]
+    for item in items:
+        args.extend(
+            (item["id"], item["version"], normalize(item["name"]), item["name"])
+        )
+    return await redis_client.run_script(INDEX_SCRIPT, keys=INDEX_KEYS, args=args)
+
+
+async def unindex_items(versions):
+    """
+    Удаляет объекты из индекса.
+    :param versions: Словарь id -> версия удаления (None — удалить без проверки версии).
+    :return: Количество удалённых записей.
+    """
+    if not versions:
+        return 0
+    args = [TOKEN_KEY_PREFIX]
+    for item_id, version in versions.items():
+        args.extend((item_id, "" if version is None else version))
+    return await redis_client.run_script(UNINDEX_SCRIPT, keys=INDEX_KEYS, args=args)
+
+
+async def search_items(query, mode="prefix", limit=settings.SEARCH_DEFAULT_LIMIT):
+    """
+    Ищет объекты по имени только в Redis, без обращения к базе.
+    :param query: Строка поиска (нормализуется так же, как имена в индексе).
+    :param mode: "prefix" — имена, начинающиеся с запроса (ZRANGEBYLEX), по алфавиту;
+                 "words" — имена, содержащие все слова запроса (SINTER), по возрастанию ID.
+    :param limit: Максимальное количество результатов.
+    :return: Список словарей {"id", "name"}.
+    """
+    normalized = normalize(query)
+    if not normalized:
+        return []
+
+    if mode == "prefix":
+        # Границы в байтах: "\xff" больше любого байта UTF-8 и закрывает диапазон префикса
+        lower = b"[" + normalized.encode()
+        members = await redis_client.redis.zrangebylex(
+            NAMES_KEY, lower, lower + b"\xff", start=0, num=limit
+        )
+        ids = [member.rpartition("\0")[2] for member in members]
+    else:
+        tokens = dict.fromkeys(normalized.split())
+        found = await redis_client.redis.sinter(
+            [TOKEN_KEY_PREFIX + token for token in tokens]
+        )
+        ids = sorted(found, key=int)[:limit]
+
+    if not ids:
+        return []
+    names = await redis_client.redis.hmget(DISPLAY_KEY, ids)
+    # Объект мог быть удалён между двумя запросами к Redis
+    return [
+        {"id": int(item_id), "name": name}
+        for item_id, name in zip(ids, names)
+        if name is not None
+    ]
+
+
+# Обновление индекса по событиям потока изменений (вне обработки запросов)
+class SearchIndexConsumer(ChangeConsumer):
+    name = "search-index"
+
+    async def handle(self, events):
+        """
+        События содержат полное состояние объекта, поэтому из пакета
+        для каждого объекта применяется только событие с наибольшей версией,
+        а скрипты индекса отбрасывают версии старше уже проиндексированных.
+        """
+        latest = {}
+        for event in events:
+            previous = latest.get(event["id"])
+            if previous is None or event["version"] >= previous["version"]:
+                latest[event["id"]] = event
+        await index_items(
+            [event["item"] for event in latest.values() if event["op"] == "upsert"]
+        )
+        await unindex_items(
+            {
+                item_id: event["version"]
+                for item_id, event in latest.items()
+                if event["op"] == "delete"
+            }
+        )
+
+
+# Полное перестроение поискового индекса из базы
+class SearchIndexRebuilder:
+    def __init__(self):
+        self.status = "idle"  # idle / running / done / failed
+        self.last_run = None  # Итоги последнего перестроения
+        self._task = None  # Фоновая задача перестроения
+
+    def start(self):
+        """
+        Запускает перестроение в фоне, если оно ещё не идёт.
+        :return: True, если перестроение запущено.
+        """
+        if self._task is not None and not self._task.done():
+            return False
+        self.status = "running"
+        self._task = asyncio.create_task(self._run())
+        return True
+
+    async def stop(self):
+        """
+        Прерывает перестроение, если оно ещё идёт.
+        """
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self):
+        try:
+            self.last_run = await self.rebuild()
+            self.status = "done"
+            logger.info("Поисковый индекс перестроен: %s", self.last_run)
+        except Exception:
+            self.status = "failed"
+            logger.exception("Не удалось перестроить поисковый индекс")
+
+    async def rebuild(self):
+        """
+        Читает имена объектов из базы порциями по SEARCH_INDEX_CHUNK_SIZE
+        и переиндексирует каждую порцию одним вызовом скрипта, затем удаляет
+        из индекса объекты, которых в базе больше нет.
+        Индекс не очищается заранее, поэтому поиск работает и во время перестроения.
+        Порции индексируются с версиями строк: объект, который потребитель потока
+        изменений успел обновить или удалить после чтения строки (или которого
+        в режиме write-behind база ещё не догнала), не откатывается к прочитанной версии.
+        ID меньше последнего прочитанного, которых не было среди прочитанных, удаляются
+        сразу вместе с запомненной версией (так же очищаются версии удаления объектов,
+        которых в базе уже нет). Большие ID (объекты, созданные во время перестроения,
+        или удалённые последними) проверяются по базе и удаляются, только если их там нет.
+        Объект, созданный в режиме write-behind и ещё не записанный в базу, тоже будет
+        удалён из индекса до следующего изменения, поэтому при включённом write-behind
+        перестроение лучше запускать при пустой очереди (GET /admin/write-behind).
+        :return: Итоги: сколько объектов проиндексировано и удалено, время.
+        """
+        started = time.monotonic()
+        seen = set()
+        last_id = 0
+
+        async with AsyncSessionLocal() as db:
+            query = (
+                select(Item.id, Item.name, Item.version)
+                .order_by(Item.id)
+                .execution_options(yield_per=settings.SEARCH_INDEX_CHUNK_SIZE)
+            )
+            result = await db.stream(query)
+            try:
+                async for rows in result.mappings().partitions():
+                    await index_items(rows)
+                    seen.update(row["id"] for row in rows)
+                    last_id = rows[-1]["id"]
+            finally:
+                await result.close()
+
+        stale = []
+        newer = []
+        indexed = set()
+        # В VERSIONS_KEY есть и проиндексированные объекты, и версии удаления;
+        # NORMALIZED_KEY — для записей, проиндексированных без версии
+        for key in (VERSIONS_KEY, NORMALIZED_KEY):
+            async for item_id, _ in redis_client.redis.hscan_iter(key):
+                indexed.add(int(item_id))
+        for item_id in indexed:
+            if item_id > last_id:
+                newer.append(item_id)
+            elif item_id not in seen:
+                stale.append(item_id)
+        stale.extend(await self._missing_in_db(newer))
+
+        removed = 0
+        for start in range(0, len(stale), settings.SEARCH_INDEX_CHUNK_SIZE):
+            removed += await unindex_items(
+                dict.fromkeys(stale[start : start + settings.SEARCH_INDEX_CHUNK_SIZE])
+            )
+
+        return {
+            "indexed": len(seen),
+            "removed": removed,
+            "elapsed": time.monotonic() - started,
+        }
+
+    async def _missing_in_db(self, item_ids):
+        """
+        Возвращает ID, которых нет в базе (запросы IN порциями по SEARCH_INDEX_CHUNK_SIZE).
+        """
+        missing = []
+        async with AsyncSessionLocal() as db:
+            for start in range(0, len(item_ids), settings.SEARCH_INDEX_CHUNK_SIZE):
+                chunk = item_ids[start : start + settings.SEARCH_INDEX_CHUNK_SIZE]
+                result = await db.execute(select(Item.id).where(Item.id.in_(chunk)))
+                existing = set(result.scalars())
+                missing.extend(item_id for item_id in chunk if item_id not in existing)
+        return missing
+
+    async def ensure_built(self):
+        """
+        Запускает перестроение, если индекса в Redis ещё нет (первый запуск
+        или пустой Redis). Существующий индекс поддерживается при изменениях объектов.
+        :return: True, если перестроение запущено.
+        """
+        if await redis_client.redis.exists(NORMALIZED_KEY):
+            return False
+        return self.start()
+
+    async def stats(self):
+        """
+        Возвращает состояние перестроения и количество объектов в индексе.
+        """
+        return {
+            "status": self.status,
+            "last_run": self.last_run,
+            "documents": await redis_client.redis.hlen(NORMALIZED_KEY),
+        }
+
+
+search_index_rebuilder = SearchIndexRebuilder()
@@ -0,0 +1,111 @@
+from fastapi import HTTPException, Request
+from app.config import settings
+from app.local_cache import LocalCache
+from app.metrics import record_cache
+from app.redis_client import redis_client
+
+# Отметки о последнем продлении TTL сессий: пока отметка жива, EXPIRE не отправляется.
+# Если отметка вытеснена раньше срока, сессия просто продлится лишний раз.
+_refresh_marks = LocalCache(
+    maxsize=settings.L1_CACHE_MAXSIZE, ttl=settings.SESSION_REFRESH_INTERVAL
+)
+
+
+def session_key(token):
+    """
+    Возвращает ключ Redis с данными сессии.
+    """
+    return f"session:{token}"
+
+
+def bearer_token(request: Request):
+    """
+    Извлекает токен из заголовка Authorization в формате 'Bearer <token>'.
+    :raises HTTPException: 401, если заголовок отсутствует или имеет неверный формат.
+    """
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        raise HTTPException(
+            status_code=401, detail="Отсутствует или неверный заголовок авторизации"
+        )
+    return auth_header.split(" ")[1]
+
+
+def _refresh_due(key):
+    """
+    Проверяет, пора ли продлевать TTL сессии, и сразу ставит отметку о продлении,
+    чтобы одновременные запросы той же сессии не отправляли EXPIRE повторно.
+    """
+    if _refresh_marks.get(key) is not None:
+        return False
+    _refresh_marks.set(key, True)
+    return True
+
+
+async def _load_session(key):
+    """
+    Читает сессию из Redis. Если пора продлить TTL, EXPIRE отправляется
+    в том же конвейере, что и HGETALL, — за один сетевой запрос.
+    """
+    if not _refresh_due(key):
+        return await redis_client.redis.hgetall(key)
+
+    async with redis_client.pipeline() as pipe:
+        pipe.hgetall(key)
+        pipe.expire(key, settings.SESSION_TTL)
+        data, _ = await pipe.execute()
+    return data
+
+
+async def get_current_session(request: Request):
+    """
+    Зависимость FastAPI: проверяет сессионный токен и возвращает данные сессии.
+    Проверенная сессия хранится в L1 процесса не дольше SESSION_CACHE_TTL секунд;
+    при выходе из системы она отзывается во всех процессах через канал инвалидаций.
+    TTL сессии в Redis продлевается не чаще раза в SESSION_REFRESH_INTERVAL секунд.
+    Пример:
+        @router.get("/me")
+        async def me(session: dict = Depends(get_current_session)):
+            ...
+    :return: Словарь {"user_id", "username", "created_at", "token"}.
+    :raises HTTPException: 401, если токен отсутствует или сессия не найдена.
+    """
+    token = bearer_token(request)
+    key = session_key(token)
+
+    local_cache = redis_client.local_cache
+    session = local_cache.get(key) if local_cache is not None else None
+    if session is not None:
+        record_cache(key, "hit")
+        if _refresh_due(key):
+            await redis_client.redis.expire(key, settings.SESSION_TTL)
+        return session
+
+    data = await _load_session(key)
+    if not data:
+        # Несуществующие токены не кэшируем, чтобы перебор токенов не вытеснял L1
+        _refresh_marks.delete(key)
+        record_cache(key, "negative")
+        raise HTTPException(status_code=401, detail="Сессия не найдена или истекла")
+
+    record_cache(key, "miss")
+    session = {
+        "user_id": int(data["user_id"]),
+        "username": data["username"],
+        "created_at": float(data["created_at"]),
+        "token": token,
+    }
+    if local_cache is not None:
+        local_cache.set(key, session, ttl=settings.SESSION_CACHE_TTL)
+    return session
+
+
+async def revoke_session(token):
+    """
+    Удаляет сессию из Redis и из L1 всех процессов.
+    :param token: Сессионный токен.
+    :return: True, если сессия существовала.
+    """
+    key = session_key(token)
+    _refresh_marks.delete(key)
+    return bool(await redis_client.invalidate(key))
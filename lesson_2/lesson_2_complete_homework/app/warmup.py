@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import random
+import time
+from sqlalchemy.future import select
+from app.config import settings
+from app.cache import make_entry
+from app.database import AsyncSessionLocal
+from app.models import Item
+from app.redis_client import VERSIONED_SET_SCRIPT, redis_client, version_key
+from app.response_cache import response_cache_key
+
+logger = logging.getLogger("warmup")
+
+
+def jittered_ttl(ex):
+    """
+    Добавляет к TTL случайную долю до CACHE_TTL_JITTER,
+    чтобы одновременно записанные ключи не истекали в один момент.
+    """
+    return ex + random.uniform(0, ex * settings.CACHE_TTL_JITTER)
+
+
+# Прогрев кэша объектов: потоковое чтение из базы и запись в Redis конвейером
+class CacheWarmer:
+    def __init__(self):
+        self.ready = False  # Завершился ли первый прогрев (для проверки готовности)
+        self.status = "idle"  # idle / running / done / failed
+        self.last_run = None  # Итоги последнего прогрева
+        self._task = None  # Фоновая задача прогрева
+
+    def start(self, overwrite=False):
+        """
+        Запускает прогрев в фоне, если он ещё не идёт.
+        :param overwrite: True — перезаписать имеющиеся в кэше значения (полное перестроение),
+                          False — заполнить только отсутствующие ключи.
+        :return: True, если прогрев запущен.
+        """
+        if self._task is not None and not self._task.done():
+            return False
+        self.status = "running"
+        self._task = asyncio.create_task(self._run(overwrite))
+        return True
+
+    async def stop(self):
+        """
+        Прерывает прогрев, если он ещё идёт.
+        """
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self, overwrite):
+        try:
+            self.last_run = await self.warm_up(overwrite)
+            self.status = "done"
+            logger.info("Прогрев кэша завершён: %s", self.last_run)
+        except Exception:
+            # Холодный кэш — деградация, а не отказ: приложение всё равно объявляется готовым
+            self.status = "failed"
+            logger.exception("Не удалось прогреть кэш")
+        finally:
+            self.ready = True
+
+    async def warm_up(self, overwrite=False):
+        """
+        Читает объекты из базы порциями по CACHE_WARMUP_CHUNK_SIZE (yield_per,
+        без загрузки всей таблицы в память) и записывает каждую порцию в Redis
+        одним конвейером с разбросом TTL.
+        Останавливается досрочно, если исчерпан бюджет времени
+        (CACHE_WARMUP_TIME_BUDGET) или объёма записанных данных (CACHE_WARMUP_MAX_MB).
+        :param overwrite: Перезаписывать ли имеющиеся значения.
+        :return: Итоги: сколько записано и пропущено, объём, время и причина остановки.
+        """
+        started = time.monotonic()
+        max_bytes = settings.CACHE_WARMUP_MAX_MB * 1024 * 1024
+        summary = {
+            "overwrite": overwrite,
+            "written": 0,
+            "skipped": 0,
+            "bytes": 0,
+            "stopped_by": "complete",
+        }
+
+        async with AsyncSessionLocal() as db:
+            query = (
+                select(Item.id, Item.name, Item.description, Item.version)
+                .order_by(Item.id)
+                .execution_options(yield_per=settings.CACHE_WARMUP_CHUNK_SIZE)
+            )
+            result = await db.stream(query)
+            try:
+                async for rows in result.mappings().partitions():
+                    written, size = await self._write_chunk(rows, overwrite)
+                    summary["written"] += written
+                    summary["skipped"] += len(rows) - written
+                    summary["bytes"] += size
+
+                    if time.monotonic() - started >= settings.CACHE_WARMUP_TIME_BUDGET:
+                        summary["stopped_by"] = "time_budget"
+                        break
+                    if summary["bytes"] >= max_bytes:
+                        summary["stopped_by"] = "memory_budget"
+                        break
+            finally:
+                await result.close()
+
+        summary["elapsed"] = time.monotonic() - started
+        return summary
+
+    async def _write_chunk(self, rows, overwrite):
+        """
+        Записывает порцию объектов одним конвейером вызовов VERSIONED_SET_SCRIPT:
+        без перезаписи — только отсутствующие ключи ("nx"), с перезаписью — если
+        в кэше нет более новой версии объекта ("cas").
+        При перезаписи заодно удаляет готовые тела ответов (и из тегов, и из L1
+        всех процессов), чтобы они собрались заново.
+        :return: (количество записанных ключей, объём записанных значений в байтах).
+        """
+        script = redis_client.script(VERSIONED_SET_SCRIPT)
+        sizes = []
+        async with redis_client.pipeline() as pipe:
+            for row in rows:
+                item = dict(row)
+                key = f"item:{item['id']}"
+                ex = jittered_ttl(settings.ITEM_CACHE_EXPIRE)
+                data = redis_client.codec.encode(make_entry(item, ex, 0.0))
+                sizes.append(len(data))
+                await script(
+                    keys=[key, version_key(key)],
+                    args=[
+                        data,
+                        int((ex + settings.CACHE_STALE_GRACE) * 1000),
+                        item["version"],
+                        "cas" if overwrite else "nx",
+                    ],
+                    client=pipe,
+                )
+            results = await pipe.execute()
+
+        if overwrite:
+            # Тело ответа помечено тегом ключа объекта (см. read_item)
+            await redis_client.invalidate_many(
+                {
+                    response_cache_key(f"item:{row['id']}"): [f"item:{row['id']}"]
+                    for row in rows
+                }
+            )
+        # Занятые ключи и более новые версии не записываются и в объём не входят
+        written = [size for size, result in zip(sizes, results) if result]
+        return len(written), sum(written)
+
+    def stats(self):
+        """
+        Возвращает состояние прогрева и итоги последнего запуска.
+        """
+        return {"ready": self.ready, "status": self.status, "last_run": self.last_run}
+
+
+cache_warmer = CacheWarmer()
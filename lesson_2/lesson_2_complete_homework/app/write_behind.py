@@ -0,0 +1,389 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+import redis.asyncio as redis
+from sqlalchemy import func
+from sqlalchemy.future import select
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import Item
+from app.cache import invalidate_item_pages, set_many
+from app.redis_client import redis_client
+from app.schemas import Item as ItemSchema
+
+logger = logging.getLogger("write_behind")
+
+# Счётчик ID объектов: при отложенной записи ID выдаёт Redis, а не база
+ITEM_ID_SEQUENCE_KEY = "items:id_seq"
+
+# Поднимает счётчик ID до максимального ID в базе, но никогда не уменьшает его
+SEED_SEQUENCE_SCRIPT = """
+local current = tonumber(redis.call("GET", KEYS[1]) or "0")
+local floor = tonumber(ARGV[1])
+if current < floor then
+    redis.call("SET", KEYS[1], floor)
+    return floor
+end
+return current
+"""
+
+# Удаляет из хэша применённых изменений (KEYS[2]) записи старше первой записи
+# потока (KEYS[1]): более старые изменения уже удалены из потока, поэтому ни
+# повторная доставка, ни запоздавшее изменение того же объекта невозможны.
+# Пустой поток — удаляются все записи. Возвращает количество удалённых полей
+TRIM_APPLIED_SCRIPT = """
+local first = redis.call("XRANGE", KEYS[1], "-", "+", "COUNT", 1)[1]
+local first_ms, first_seq
+if first then
+    local ms, seq = string.match(first[1], "(%d+)-(%d+)")
+    first_ms, first_seq = tonumber(ms), tonumber(seq)
+end
+local applied = redis.call("HGETALL", KEYS[2])
+local stale = {}
+for i = 1, #applied, 2 do
+    local ms, seq = string.match(applied[i + 1], "(%d+)-(%d+)")
+    ms, seq = tonumber(ms), tonumber(seq)
+    if not first or ms < first_ms or (ms == first_ms and seq < first_seq) then
+        table.insert(stale, applied[i])
+    end
+end
+for i = 1, #stale, 1000 do
+    redis.call("HDEL", KEYS[2], unpack(stale, i, math.min(i + 999, #stale)))
+end
+return #stale
+"""
+
+
+def applied_key():
+    """
+    Ключ хэша item_id -> ID последнего применённого к базе изменения из потока.
+    По нему повторно доставленные и устаревшие изменения пропускаются.
+    Записи, которые старше всех оставшихся в потоке, удаляются (TRIM_APPLIED_SCRIPT).
+    """
+    return f"{settings.WRITE_BEHIND_STREAM}:applied"
+
+
+def lock_key():
+    """
+    Ключ блокировки: изменения применяет один процесс за раз, чтобы они
+    попадали в базу в порядке потока (SQLite всё равно допускает одного писателя).
+    """
+    return f"lock:{settings.WRITE_BEHIND_STREAM}"
+
+
+def _entry_order(entry_id):
+    """
+    Преобразует ID записи потока "<ms>-<seq>" в кортеж для сравнения.
+    """
+    ms, seq = entry_id.split("-")
+    return int(ms), int(seq)
+
+
+async def next_item_id():
+    """
+    Выделяет ID для нового объекта.
+    """
+    return await redis_client.incr(ITEM_ID_SEQUENCE_KEY)
+
+
+async def next_item_ids(count):
+    """
+    Выделяет подряд идущие ID для count новых объектов одной командой INCRBY.
+    :return: Список ID.
+    """
+    last = await redis_client.redis.incrby(ITEM_ID_SEQUENCE_KEY, count)
+    return list(range(last - count + 1, last + 1))
+
+
+def _upsert_fields(item):
+    """
+    Поля записи потока для создания или обновления объекта.
+    Версия объекта в кэше записывается в базу вместе с изменением.
+    """
+    return {
+        "op": "upsert",
+        "id": item["id"],
+        "name": item["name"],
+        "description": item["description"],
+        "version": item["version"],
+    }
+
+
+async def enqueue_upsert(item):
+    """
+    Ставит в очередь запись объекта в базу (создание или полное обновление).
+    :param item: Словарь {"id", "name", "description", "version"}.
+    """
+    await redis_client.redis.xadd(settings.WRITE_BEHIND_STREAM, _upsert_fields(item))
+
+
+async def enqueue_upserts(items):
+    """
+    Ставит в очередь запись нескольких объектов одним конвейером XADD.
+    :param items: Список словарей {"id", "name", "description", "version"}.
+    """
+    async with redis_client.pipeline() as pipe:
+        for item in items:
+            pipe.xadd(settings.WRITE_BEHIND_STREAM, _upsert_fields(item))
+        await pipe.execute()
+
+
+async def enqueue_delete(item_id):
+    """
+    Ставит в очередь удаление объекта из базы.
+    """
+    await redis_client.redis.xadd(
+        settings.WRITE_BEHIND_STREAM, {"op": "delete", "id": item_id}
+    )
+
+
+# Фоновый потребитель потока изменений, применяющий их к базе пакетами
+class WriteBehindWorker:
+    def __init__(self):
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"  # Имя в группе
+        self._task = None  # Фоновая задача потребителя
+        self._stopping = None  # Событие остановки
+        self.applied = 0  # Сколько изменений применено этим процессом
+        self.skipped = 0  # Сколько повторных или устаревших изменений пропущено
+        self.failed_batches = 0  # Сколько пакетов не удалось применить
+
+    async def start(self):
+        """
+        Создаёт группу потребителей (если её нет), выравнивает счётчик ID
+        по базе и запускает фоновую задачу.
+        """
+        try:
+            await redis_client.redis.xgroup_create(
+                settings.WRITE_BEHIND_STREAM,
+                settings.WRITE_BEHIND_GROUP,
+                id="0",
+                mkstream=True,
+            )
+        except redis.ResponseError as error:
+            if "BUSYGROUP" not in str(error):
+                raise
+
+        async with AsyncSessionLocal() as db:
+            max_id = (await db.execute(select(func.max(Item.id)))).scalar() or 0
+        await redis_client.run_script(
+            SEED_SEQUENCE_SCRIPT, keys=[ITEM_ID_SEQUENCE_KEY], args=[max_id]
+        )
+
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает потребителя после текущего пакета.
+        Неприменённые изменения остаются в потоке и будут применены после перезапуска.
+        """
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            started = time.monotonic()
+            try:
+                processed = await self.process_once()
+            except Exception:
+                # Пакет остаётся неподтверждённым и будет забран повторно
+                # через WRITE_BEHIND_CLAIM_IDLE_MS
+                self.failed_batches += 1
+                logger.exception("Не удалось применить пакет изменений к базе")
+                await asyncio.sleep(1)
+                continue
+            if not processed:
+                # Пустое чтение ждёт до WRITE_BEHIND_BLOCK_MS (BLOCK у XREADGROUP), но
+                # серверы без блокирующего чтения (например, fakeredis) отвечают сразу:
+                # тогда выдерживаем остаток паузы сами, чтобы цикл не занимал процессор
+                await self._wait_stopping(
+                    settings.WRITE_BEHIND_BLOCK_MS / 1000 - (time.monotonic() - started)
+                )
+
+    async def _wait_stopping(self, timeout):
+        """
+        Ждёт остановки не дольше timeout секунд.
+        """
+        if timeout <= 0:
+            return
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def process_once(self):
+        """
+        Берёт блокировку писателя, читает пакет изменений и применяет его к базе.
+        Сначала забираются изменения, зависшие у упавших потребителей, затем новые.
+        :return: Количество обработанных записей потока.
+        """
+        token = uuid.uuid4().hex
+        if not await redis_client.acquire_lock(
+            lock_key(), token, px=settings.WRITE_BEHIND_LOCK_MS
+        ):
+            # Изменения применяет другой процесс — ждём своей очереди
+            await self._wait_stopping(settings.WRITE_BEHIND_BLOCK_MS / 1000)
+            return 0
+
+        try:
+            entries = await self._claim_stale()
+            if not entries:
+                response = await redis_client.redis.xreadgroup(
+                    settings.WRITE_BEHIND_GROUP,
+                    self.consumer,
+                    {settings.WRITE_BEHIND_STREAM: ">"},
+                    count=settings.WRITE_BEHIND_BATCH_SIZE,
+                    block=settings.WRITE_BEHIND_BLOCK_MS,
+                )
+                entries = response[0][1] if response else []
+            if entries:
+                await self._apply(entries)
+            return len(entries)
+        finally:
+            await redis_client.release_lock(lock_key(), token)
+
+    async def _claim_stale(self):
+        """
+        Забирает изменения, которые были доставлены, но не подтверждены
+        дольше WRITE_BEHIND_CLAIM_IDLE_MS (потребитель упал или пакет не применился).
+        """
+        result = await redis_client.redis.xautoclaim(
+            settings.WRITE_BEHIND_STREAM,
+            settings.WRITE_BEHIND_GROUP,
+            self.consumer,
+            min_idle_time=settings.WRITE_BEHIND_CLAIM_IDLE_MS,
+            start_id="0-0",
+            count=settings.WRITE_BEHIND_BATCH_SIZE,
+        )
+        return [(entry_id, fields) for entry_id, fields in result[1] if fields]
+
+    async def _apply(self, entries):
+        """
+        Применяет пакет изменений одной транзакцией.
+        Для каждого объекта важно только последнее изменение в пакете, поскольку
+        изменения содержат полное состояние. Изменения не новее уже применённых
+        пропускаются, поэтому повторная доставка безопасна.
+        После фиксации транзакции записи подтверждаются и удаляются из потока,
+        а записанные объекты сохраняются в кэш через compare-and-set: промах,
+        прочитавший из базы ещё не обновлённую строку, мог закэшировать устаревшую версию.
+        """
+        item_ids = list(dict.fromkeys(int(fields["id"]) for _, fields in entries))
+        applied_ids = dict(
+            zip(item_ids, await redis_client.redis.hmget(applied_key(), item_ids))
+        )
+
+        latest = {}  # item_id -> (entry_id, fields) последнего изменения
+        for entry_id, fields in entries:
+            item_id = int(fields["id"])
+            applied_id = applied_ids[item_id]
+            if applied_id and _entry_order(applied_id) >= _entry_order(entry_id):
+                self.skipped += 1
+                continue
+            latest[item_id] = (entry_id, fields)
+
+        deleted = []
+        written = {}  # Ключ кэша -> записанный в базу объект
+        if latest:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(select(Item).where(Item.id.in_(list(latest))))
+                existing = {item.id: item for item in result.scalars()}
+                for item_id, (_, fields) in latest.items():
+                    item = existing.get(item_id)
+                    if fields["op"] == "delete":
+                        if item is not None:
+                            await db.delete(item)
+                        deleted.append(item_id)
+                        continue
+                    if item is None:
+                        item = Item(id=item_id)
+                        db.add(item)
+                    item.name = fields["name"]
+                    item.description = fields["description"]
+                    # Изменения, поставленные в очередь до появления версий, её не содержат
+                    if "version" in fields:
+                        item.version = int(fields["version"])
+                        written[f"item:{item_id}"] = item
+                await db.commit()
+
+        entry_ids = [entry_id for entry_id, _ in entries]
+        async with redis_client.pipeline() as pipe:
+            if latest:
+                pipe.hset(
+                    applied_key(),
+                    mapping={
+                        item_id: entry_id for item_id, (entry_id, _) in latest.items()
+                    },
+                )
+            pipe.xack(
+                settings.WRITE_BEHIND_STREAM, settings.WRITE_BEHIND_GROUP, *entry_ids
+            )
+            pipe.xdel(settings.WRITE_BEHIND_STREAM, *entry_ids)
+            await redis_client.script(TRIM_APPLIED_SCRIPT)(
+                keys=[settings.WRITE_BEHIND_STREAM, applied_key()], client=pipe
+            )
+            await pipe.execute()
+        self.applied += len(latest)
+
+        if written:
+            await set_many(
+                {
+                    key: ItemSchema.model_validate(item).model_dump()
+                    for key, item in written.items()
+                },
+                ex=settings.ITEM_CACHE_EXPIRE,
+                broadcast=True,
+                versioned=True,
+            )
+            # Готовый ответ мог быть построен из той же устаревшей версии
+            for key in written:
+                await redis_client.invalidate_tag(key)
+
+        # Пока удаление не дошло до базы, объект мог снова попасть в кэш при промахе
+        for item_id in deleted:
+            await redis_client.invalidate(f"item:{item_id}")
+            await redis_client.invalidate_tag(f"item:{item_id}")
+        if latest:
+            # Страницы списка читаются из базы и теперь должны включать изменения
+            await invalidate_item_pages()
+
+    async def stats(self):
+        """
+        Возвращает состояние очереди: сколько изменений ещё не доставлено (lag),
+        сколько доставлено, но не подтверждено, и возраст самого старого из них.
+        Применённые записи удаляются из потока, поэтому его длина — это весь отставший хвост.
+        """
+        stream = settings.WRITE_BEHIND_STREAM
+        length = await redis_client.redis.xlen(stream)
+        try:
+            pending = await redis_client.redis.xpending(
+                stream, settings.WRITE_BEHIND_GROUP
+            )
+        except redis.ResponseError:
+            # Группа ещё не создана
+            pending = {"pending": 0, "min": None}
+
+        oldest_age_ms = None
+        if pending["pending"] and pending["min"]:
+            oldest_age_ms = int(time.time() * 1000) - _entry_order(pending["min"])[0]
+
+        return {
+            "enabled": settings.WRITE_BEHIND_ENABLED,
+            "running": self._task is not None,
+            "consumer": self.consumer,
+            "stream_length": length,
+            "lag": length - pending["pending"],
+            "pending": pending["pending"],
+            "oldest_pending_age_ms": oldest_age_ms,
+            "applied": self.applied,
+            "skipped": self.skipped,
+            "failed_batches": self.failed_batches,
+        }
+
+
+write_behind = WriteBehindWorker()
@@ -0,0 +1,86 @@
+"""
+Микробенчмарк кодеков значений кэша на данных, похожих на реальные Item.
+
+Запуск из каталога проекта:
+    python -m bench.codecs_benchmark
+
+Сравниваются все доступные комбинации формата и сжатия:
+время сериализации/десериализации одной записи и её размер в байтах.
+Недоступные кодеки (не установлен пакет) пропускаются.
+"""
+
+import time
+from faker import Faker
+from app.codecs import CODECS, COMPRESSIONS, ValueCodec
+
+fake = Faker("ru_RU")
+Faker.seed(0)
+
+
+def make_item(item_id, description_sentences=3):
+    """
+    Создаёт объект в том виде, в котором он хранится в кэше (ItemSchema.model_dump()).
+    """
+    return {
+        "id": item_id,
+        "name": fake.catch_phrase(),
+        "description": fake.paragraph(nb_sentences=description_sentences),
+        "version": 1,
+    }
+
+
+def make_entry(value):
+    """
+    Оборачивает значение в запись кэша с логическим сроком истечения.
+    """
+    return {"v": value, "exp": time.time() + 60, "delta": 0.0015}
+
+
+# Наборы данных: одиночный объект, страница списка и объект с длинным описанием
+PAYLOADS = {
+    "item": make_entry(make_item(1)),
+    "page_50": make_entry(
+        {"items": [make_item(i) for i in range(1, 51)], "next_cursor": 50}
+    ),
+    "item_long": make_entry(make_item(2, description_sentences=60)),
+}
+
+
+def measure(func, arg, min_time=0.2):
+    """
+    Возвращает среднее время одного вызова func(arg) в микросекундах.
+    """
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        for _ in range(100):
+            func(arg)
+        calls += 100
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return elapsed / calls * 1_000_000
+
+
+def main():
+    print(
+        f"{'payload':<10} {'codec':<8} {'compression':<11} "
+        f"{'bytes':>7} {'encode, мкс':>12} {'decode, мкс':>12}"
+    )
+    for payload_name, payload in PAYLOADS.items():
+        for codec_name in CODECS:
+            for compression_name in COMPRESSIONS:
+                try:
+                    codec = ValueCodec(codec_name, compression_name, threshold=256)
+                except RuntimeError:
+                    continue
+                encoded = codec.encode(payload)
+                assert codec.decode(encoded) == payload
+                print(
+                    f"{payload_name:<10} {codec_name:<8} {compression_name:<11} "
+                    f"{len(encoded):>7} {measure(codec.encode, payload):>12.2f} "
+                    f"{measure(codec.decode, encoded):>12.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
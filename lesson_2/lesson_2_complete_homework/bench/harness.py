@@ -0,0 +1,124 @@
+"""
+Общий каркас бенчмарков: поднимает app.main:app в текущем процессе
+на временной базе SQLite и отдаёт HTTP-клиент, работающий напрямую через ASGI.
+
+Redis берётся из настроек приложения (REDIS_HOST/REDIS_PORT), поэтому перед запуском
+нужен локальный Redis, либо use_fakeredis() до запуска приложения.
+Пакеты httpx и fakeredis[lua] входят в группу зависимостей dev (poetry install --with dev).
+"""
+
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+# База создаётся во временном каталоге, настройки читаются при импорте app,
+# поэтому переменную окружения нужно выставить до импорта модулей приложения
+_tmpdir = tempfile.mkdtemp(prefix="bench-")
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+)
+
+import httpx  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.database import engine  # noqa: E402
+from app.main import app, lifespan  # noqa: E402
+from app.redis_client import InstrumentedConnectionPool, redis_client  # noqa: E402
+from app.warmup import cache_warmer  # noqa: E402
+
+# Логирование каждого SQL-запроса и отладочные логи авторизации искажают замеры
+engine.echo = False
+logging.getLogger("auth").setLevel(logging.WARNING)
+
+
+def use_fakeredis():
+    """
+    Подключает приложение к fakeredis вместо Redis-сервера.
+    Задержки Redis при этом не включают сеть, поэтому абсолютные числа ниже реальных,
+    но запуски на одной машине можно сравнивать между собой.
+    Потребители потока изменений (поисковый индекс) при этом не запускаются.
+    :return: FakeServer — общее хранилище, к которому можно подключить и другие клиенты.
+    """
+    import fakeredis
+    from fakeredis.aioredis import FakeConnection
+
+    server = fakeredis.FakeServer(version=(7,))
+
+    def make_pool(decode_responses):
+        return InstrumentedConnectionPool(
+            connection_class=FakeConnection,
+            server=server,
+            decode_responses=decode_responses,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+        )
+
+    redis_client._make_pool = make_pool
+    # fakeredis не поддерживает блокирующий XREADGROUP (BLOCK возвращается сразу),
+    # и фоновые потребители потока изменений крутились бы в цикле, отнимая процессор.
+    # Фоновая запись write-behind после пустого чтения выдерживает паузу сама
+    settings.CHANGE_STREAM_CONSUMERS_ENABLED = False
+    return server
+
+
+@asynccontextmanager
+async def asgi_client(asgi_app):
+    """
+    Возвращает клиент httpx, отправляющий запросы напрямую в ASGI-приложение.
+    """
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        yield client
+
+
+@asynccontextmanager
+async def running_app():
+    """
+    Запускает жизненный цикл приложения и возвращает клиент httpx для запросов к нему.
+    Управление передаётся после завершения прогрева кэша, как при штатном запуске.
+    """
+    async with lifespan(app):
+        while not cache_warmer.ready:
+            await asyncio.sleep(0.01)
+        async with asgi_client(app) as client:
+            yield client
+
+
+async def timed(coro):
+    """
+    Выполняет корутину и возвращает (результат, длительность в секундах).
+    """
+    started = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - started
+
+
+def summarize(latencies, elapsed=None):
+    """
+    Сводка по задержкам: количество, пропускная способность и перцентили в миллисекундах.
+    :param latencies: Список длительностей запросов в секундах.
+    :param elapsed: Общее время сценария в секундах (для расчёта запросов в секунду).
+    """
+    if not latencies:
+        return {"count": 0}
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+    summary = {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+    if elapsed:
+        summary["rps"] = len(ordered) / elapsed
+    return summary
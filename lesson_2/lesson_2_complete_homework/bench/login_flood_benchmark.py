@@ -0,0 +1,97 @@
+"""
+Бенчмарк: задержка чтения закэшированного объекта до и во время потока логинов.
+
+Запуск из каталога проекта (нужен локальный Redis):
+    python -m bench.login_flood_benchmark
+
+Пока bcrypt выполняется в цикле событий, каждый логин на десятки миллисекунд
+останавливает все остальные запросы. После выноса хэширования в пул потоков
+задержка чтения во время потока логинов должна оставаться близкой к исходной.
+Результат печатается в формате JSON.
+"""
+
+import asyncio
+import json
+import time
+from bench.harness import running_app, summarize
+
+READS = 500  # Количество чтений в каждой фазе
+READ_INTERVAL = 0.002  # Интервал между запусками чтений в секундах
+LOGIN_CONCURRENCY = 20  # Одновременных логинов во время потока
+
+
+async def read_phase(client, item_id):
+    """
+    Запускает READS чтений объекта с постоянным темпом (раз в READ_INTERVAL)
+    и возвращает задержки. Задержка отсчитывается от запланированного момента запуска,
+    поэтому время, пока цикл событий был занят и не мог начать запрос, тоже учитывается.
+    """
+    latencies = []
+
+    async def read(scheduled):
+        response = await client.get(f"/items/{item_id}")
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - scheduled)
+
+    started = time.perf_counter()
+    tasks = []
+    for i in range(READS):
+        scheduled = started + i * READ_INTERVAL
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        tasks.append(asyncio.create_task(read(scheduled)))
+    await asyncio.gather(*tasks)
+    return latencies, time.perf_counter() - started
+
+
+async def login_flood(client, stop, counters):
+    """
+    Непрерывно выполняет логины, пока не выставлено событие stop.
+    """
+    while not stop.is_set():
+        response = await client.post(
+            "/auth/login", json={"username": "bench", "password": "bench-password"}
+        )
+        counters[response.status_code] = counters.get(response.status_code, 0) + 1
+
+
+async def main():
+    async with running_app() as client:
+        await client.post(
+            "/auth/register",
+            json={"name": "Bench", "username": "bench", "password": "bench-password"},
+        )
+        item = (
+            await client.post(
+                "/items/create/", json={"name": "hot", "description": "item"}
+            )
+        ).json()
+        # Прогреваем кэш, чтобы мерить именно чтение из кэша
+        await client.get(f"/items/{item['id']}")
+
+        baseline, baseline_elapsed = await read_phase(client, item["id"])
+
+        stop = asyncio.Event()
+        counters = {}
+        flood = [
+            asyncio.create_task(login_flood(client, stop, counters))
+            for _ in range(LOGIN_CONCURRENCY)
+        ]
+        await asyncio.sleep(0.5)  # Даём потоку логинов разогнаться
+        during, during_elapsed = await read_phase(client, item["id"])
+        stop.set()
+        await asyncio.gather(*flood)
+
+    print(
+        json.dumps(
+            {
+                "baseline": summarize(baseline, baseline_elapsed),
+                "during_login_flood": summarize(during, during_elapsed),
+                "login_status_codes": counters,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,401 @@
+"""
+Набор нагрузочных сценариев приложения с результатами в JSON.
+
+Запуск из каталога проекта:
+    python -m bench.suite                          # локальный Redis из настроек
+    python -m bench.suite --fakeredis              # без Redis-сервера
+    python -m bench.suite --scenarios cached_reads,writes --output results.json
+
+Приложение (app.main:app) поднимается в текущем процессе на временной базе SQLite.
+Сценарии:
+    cached_reads      — чтение объектов из прогретого кэша;
+    cold_reads        — чтение объектов, которых нет в кэше (каждый ID читается один раз);
+    writes            — обновление (70%) и создание (30%) объектов;
+    creates           — создание объектов по одному (POST /items/create/);
+    bulk_creates      — создание тех же объектов порциями по --bulk-size (POST /items/bulk);
+    login_logout      — вход и выход пользователя (включает bcrypt);
+    mixed             — чтения, страницы списка, записи и логины вперемешку;
+    example_counter   — счётчик из lesson_2_livecoding/example_fastapi.py;
+    example_profiles  — профили из lesson_2_livecoding/example_fastapi.py.
+
+Последовательность запросов каждого сценария определяется параметром --seed,
+поэтому результаты запусков с одинаковыми параметрами можно сравнивать (diff).
+Для каждого сценария выводятся пропускная способность (rps), p50/p95/p99 и число ошибок,
+для сценариев создания — ещё и число созданных объектов в секунду (rows_per_second).
+С локальным Redis бенчмарк пишет ключи в базу REDIS_DB — выберите отдельную базу.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+from bench.harness import asgi_client, running_app, summarize, use_fakeredis
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import Item
+from app.redis_client import redis_client
+from app.response_cache import response_cache_key
+
+LIVECODING_DIR = Path(__file__).resolve().parents[2] / "lesson_2_livecoding"
+
+SCENARIOS = (
+    "cached_reads",
+    "cold_reads",
+    "writes",
+    "creates",
+    "bulk_creates",
+    "login_logout",
+    "mixed",
+    "example_counter",
+    "example_profiles",
+)
+
+
+async def run_load(execute, plan, concurrency):
+    """
+    Выполняет заранее составленный план запросов в concurrency параллельных
+    потоках (замкнутый цикл: следующий запрос уходит после ответа на предыдущий).
+    :param execute: Асинхронная функция, выполняющая один шаг плана;
+                    исключение считается ошибкой.
+    :param plan: Список параметров шагов.
+    :param concurrency: Количество параллельных потоков.
+    :return: Сводка summarize и количество ошибок.
+    """
+    latencies = []
+    errors = 0
+    steps = iter(plan)
+
+    async def worker():
+        nonlocal errors
+        for step in steps:
+            started = time.perf_counter()
+            try:
+                await execute(step)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    summary = summarize(latencies, time.perf_counter() - started)
+    summary["errors"] = errors
+    return summary
+
+
+async def seed_items(count):
+    """
+    Заполняет базу объектами напрямую, минуя API.
+    :return: Список ID.
+    """
+    async with AsyncSessionLocal() as db:
+        items = [
+            Item(name=f"item {i}", description=f"description of item {i} " * 4)
+            for i in range(count)
+        ]
+        db.add_all(items)
+        await db.commit()
+        return [item.id for item in items]
+
+
+async def register_users(client, count):
+    """
+    Регистрирует пользователей для сценариев входа.
+    :return: Список пар (логин, пароль).
+    """
+    users = [(f"bench-user-{i}", f"bench-password-{i}") for i in range(count)]
+    for username, password in users:
+        response = await client.post(
+            "/auth/register",
+            json={"name": username, "username": username, "password": password},
+        )
+        response.raise_for_status()
+    return users
+
+
+def check(response):
+    response.raise_for_status()
+    return response
+
+
+async def login_logout(client, user):
+    username, password = user
+    response = check(
+        await client.post(
+            "/auth/login", json={"username": username, "password": password}
+        )
+    )
+    token = response.json()["token"]
+    check(
+        await client.post("/auth/logout", headers={"Authorization": f"Bearer {token}"})
+    )
+
+
+async def main_app_scenarios(args, selected):
+    """
+    Выполняет сценарии основного приложения.
+    """
+    results = {}
+    async with running_app() as client:
+        item_ids = await seed_items(args.items)
+        hot_ids = item_ids[: args.hot_items]
+        users = await register_users(client, args.users)
+        for item_id in hot_ids:
+            check(await client.get(f"/items/{item_id}"))
+
+        async def read(item_id):
+            check(await client.get(f"/items/{item_id}"))
+
+        async def write(step):
+            kind, item_id, name = step
+            body = {"name": name, "description": "updated by benchmark"}
+            if kind == "update":
+                check(await client.put(f"/items/{item_id}", json=body))
+            else:
+                check(await client.post("/items/create/", json=body))
+
+        async def bulk_create(rows):
+            response = check(await client.post("/items/bulk", json=rows))
+            if response.json()["errors"]:
+                raise RuntimeError(response.json()["errors"][0]["error"])
+
+        async def mixed(step):
+            kind, value = step
+            if kind == "read":
+                await read(value)
+            elif kind == "page":
+                check(await client.get("/items/", params={"after": value}))
+            elif kind == "write":
+                await write(("update", value, "mixed"))
+            else:
+                await login_logout(client, value)
+
+        for name in selected:
+            rng = random.Random(f"{args.seed}:{name}")
+            if name == "cached_reads":
+                plan = [rng.choice(hot_ids) for _ in range(args.requests)]
+                results[name] = await run_load(read, plan, args.concurrency)
+            elif name == "cold_reads":
+                plan = rng.sample(item_ids, min(args.requests, len(item_ids)))
+                await drop_cached_items(plan)
+                results[name] = await run_load(read, plan, args.concurrency)
+            elif name == "writes":
+                plan = [
+                    (
+                        "update" if rng.random() < 0.7 else "create",
+                        rng.choice(item_ids),
+                        f"bench {i}",
+                    )
+                    for i in range(args.requests)
+                ]
+                results[name] = await run_load(write, plan, args.concurrency)
+            elif name in ("creates", "bulk_creates"):
+                rows = [
+                    {
+                        "name": f"bulk {rng.random()}",
+                        "description": "created by benchmark",
+                    }
+                    for _ in range(args.requests)
+                ]
+                if name == "creates":
+                    plan = [("create", None, row["name"]) for row in rows]
+                    summary = await run_load(write, plan, args.concurrency)
+                else:
+                    plan = [
+                        rows[start : start + args.bulk_size]
+                        for start in range(0, len(rows), args.bulk_size)
+                    ]
+                    summary = await run_load(bulk_create, plan, args.concurrency)
+                # Запросов в секунду * объектов в запросе = объектов в секунду
+                summary["rows_per_second"] = (
+                    summary.get("rps", 0) * len(rows) / len(plan)
+                )
+                results[name] = summary
+            elif name == "login_logout":
+                plan = [rng.choice(users) for _ in range(args.logins)]
+                results[name] = await run_load(
+                    lambda user: login_logout(client, user), plan, args.concurrency
+                )
+            elif name == "mixed":
+                plan = [
+                    mixed_step(rng, hot_ids, item_ids, users)
+                    for _ in range(args.requests)
+                ]
+                results[name] = await run_load(mixed, plan, args.concurrency)
+    return results
+
+
+def mixed_step(rng, hot_ids, item_ids, users):
+    """
+    Шаг смешанной нагрузки: 90% чтений, 4% страниц списка, 5% записей, 1% логинов.
+    """
+    roll = rng.random()
+    if roll < 0.90:
+        return "read", rng.choice(hot_ids)
+    if roll < 0.94:
+        return "page", rng.choice(item_ids)
+    if roll < 0.99:
+        return "write", rng.choice(item_ids)
+    return "login", rng.choice(users)
+
+
+async def drop_cached_items(item_ids):
+    """
+    Удаляет объекты и готовые ответы из кэша (Redis и L1), чтобы чтения шли в базу.
+    """
+    async with redis_client.pipeline() as pipe:
+        for item_id in item_ids:
+            pipe.delete(f"item:{item_id}", response_cache_key(f"item:{item_id}"))
+        await pipe.execute()
+    if redis_client.local_cache is not None:
+        redis_client.local_cache.clear()
+
+
+async def example_scenarios(args, selected, fake_server):
+    """
+    Выполняет сценарии учебного приложения lesson_2_livecoding/example_fastapi.py.
+    """
+    sys.path.insert(0, str(LIVECODING_DIR))
+    import example_fastapi
+
+    if fake_server is not None:
+        from fakeredis.aioredis import FakeRedis
+
+        example_fastapi.redis_client = FakeRedis(
+            server=fake_server, decode_responses=True
+        )
+
+    results = {}
+    example_app = example_fastapi.app
+    async with example_app.router.lifespan_context(example_app):
+        async with asgi_client(example_app) as client:
+            user_ids = list(example_fastapi.db)
+
+            async def counter(kind):
+                if kind == "increment":
+                    check(await client.post("/increment"))
+                else:
+                    check(await client.get("/value"))
+
+            async def profile(step):
+                kind, user_id = step
+                if kind == "get":
+                    check(await client.get(f"/user/{user_id}/profile"))
+                else:
+                    check(
+                        await client.put(f"/user/{user_id}/profile", json={"age": "30"})
+                    )
+
+            for name in selected:
+                rng = random.Random(f"{args.seed}:{name}")
+                if name == "example_counter":
+                    plan = [
+                        "increment" if rng.random() < 0.5 else "value"
+                        for _ in range(args.requests)
+                    ]
+                    results[name] = await run_load(counter, plan, args.concurrency)
+                elif name == "example_profiles":
+                    plan = [
+                        ("get" if rng.random() < 0.8 else "put", rng.choice(user_ids))
+                        for _ in range(args.requests)
+                    ]
+                    results[name] = await run_load(profile, plan, args.concurrency)
+    return results
+
+
+def git_commit():
+    """
+    Возвращает текущий коммит, чтобы результаты можно было связать с кодом.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help="Сценарии через запятую (по умолчанию все)",
+    )
+    parser.add_argument(
+        "--fakeredis", action="store_true", help="Использовать fakeredis"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=2000, help="Запросов на сценарий"
+    )
+    parser.add_argument("--logins", type=int, default=40, help="Входов в login_logout")
+    parser.add_argument(
+        "--concurrency", type=int, default=16, help="Параллельных потоков"
+    )
+    parser.add_argument("--items", type=int, default=2000, help="Объектов в базе")
+    parser.add_argument(
+        "--hot-items", type=int, default=100, help="Объектов в горячем наборе"
+    )
+    parser.add_argument(
+        "--bulk-size", type=int, default=500, help="Объектов в запросе bulk_creates"
+    )
+    parser.add_argument("--users", type=int, default=4, help="Пользователей для входа")
+    parser.add_argument("--seed", type=int, default=0, help="Зерно генератора планов")
+    parser.add_argument("--output", help="Файл для результатов в JSON")
+    args = parser.parse_args()
+
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Неизвестные сценарии: {', '.join(sorted(unknown))}")
+    return args, selected
+
+
+async def main():
+    args, selected = parse_args()
+    fake_server = use_fakeredis() if args.fakeredis else None
+
+    results = {}
+    main_selected = [name for name in selected if not name.startswith("example_")]
+    example_selected = [name for name in selected if name.startswith("example_")]
+    if main_selected:
+        results.update(await main_app_scenarios(args, main_selected))
+    if example_selected:
+        results.update(await example_scenarios(args, example_selected, fake_server))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "redis": (
+                "fakeredis"
+                if args.fakeredis
+                else f"{settings.REDIS_HOST}:{settings.REDIS_PORT}/{settings.REDIS_DB}"
+            ),
+            "cache_codec": settings.CACHE_CODEC,
+            "cache_compression": settings.CACHE_COMPRESSION,
+            "l1_cache": settings.L1_CACHE_ENABLED,
+            "write_behind": settings.WRITE_BEHIND_ENABLED,
+            "params": {
+                key: value for key, value in vars(args).items() if key != "output"
+            },
+        },
+        "scenarios": {name: results[name] for name in selected},
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())